@@ -1,6 +1,6 @@
-import mysql.connector
+from repositorio import obter_repositorio, ErroDeBanco
 
-# Configurações do Banco de Dados MySQL
+# Configurações do Banco de Dados MySQL (com CLINICA_BACKEND=sqlite, usa o arquivo de SQLITE_PATH)
 DB_CONFIG = {
     'host': 'localhost',
     'user': 'root',
@@ -8,19 +8,16 @@ DB_CONFIG = {
     'database': 'clinica_bot'
 }
 
-def adicionar_medico(nome, dia, inicio, fim):
-    """Adiciona um novo médico e sua disponibilidade no banco de dados."""
+def adicionar_medico(nome, dia, inicio, fim, especialidade=None):
+    """Adiciona um novo médico ao catálogo e sua disponibilidade no banco de dados."""
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        query = "INSERT INTO medico_disponibilidade (medico_nome, dia_da_semana, horario_inicio, horario_fim) VALUES (%s, %s, %s, %s)"
-        cursor.execute(query, (nome, dia, inicio, fim))
-        conn.commit()
-        cursor.close()
-        conn.close()
+        repositorio = obter_repositorio(DB_CONFIG)
+        repositorio.criar_tabelas()
+        # Cadastra (ou atualiza) o médico no catálogo; o atualizado_em avisa os outros processos
+        repositorio.adicionar_medico(nome, dia, inicio, fim, especialidade)
         print(f"Médico {nome} adicionado com sucesso para {dia}, das {inicio} às {fim}.")
-    except mysql.connector.Error as err:
+    except ErroDeBanco as err:
         print(f"Erro ao adicionar médico: {err}")
 
 # Exemplo de uso: adicione os dados que estão faltando
-adicionar_medico('Dr. Carlos', 'Quinta-feira', '08:00', '18:00')
\ No newline at end of file
+adicionar_medico('Dr. Carlos', 'Quinta-feira', '08:00', '18:00', 'Cardiologia')
@@ -1,6 +1,11 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response
 from flask_cors import CORS
-import mysql.connector
+import threading
+from eventos import FeedDeAgendamentos, formatar_sse, iniciar_acompanhamento
+from catalogo import Catalogo
+from repositorio import obter_repositorio, ErroDeBanco, HorarioIndisponivel
+from perfilador import Perfilador, como_booleano
+import os
 
 # Adiciona o parâmetro static_folder para que o servidor consiga encontrar os arquivos estáticos
 app = Flask(__name__, static_folder='.', static_url_path='')
@@ -16,23 +21,57 @@ DB_CONFIG = {
     'database': 'clinica_bot'
 }
 
+# --- Feed de mudanças para o Server-Sent Events ---
+feed = FeedDeAgendamentos()
+_acompanhamento_lock = threading.Lock()
+_acompanhamento_iniciado = False
+
+# --- Banco de dados (CLINICA_BACKEND=mysql|sqlite; réplicas MySQL em DB_REPLICAS="host1,host2:3307") ---
+repositorio = obter_repositorio(DB_CONFIG)
+
+# --- Profiling por amostragem (PERFIL_ATIVO=1 ou rota /admin/perfil com ADMIN_TOKEN) ---
+perfilador = Perfilador.do_ambiente()
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# --- Catálogo de médicos e especialidades ---
+catalogo = Catalogo(repositorio)
+
+def garantir_acompanhamento():
+    """Inicia (uma única vez) a thread que lê os eventos gravados por API, painel e bot."""
+    global _acompanhamento_iniciado
+    with _acompanhamento_lock:
+        if not _acompanhamento_iniciado:
+            iniciar_acompanhamento(feed, repositorio)
+            _acompanhamento_iniciado = True
+
 # --- Rota para obter todos os agendamentos ---
 @app.route('/agendamentos', methods=['GET'])
+@perfilador.perfilar('api.get_agendamentos')
 def get_agendamentos():
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor(dictionary=True)
-        query = "SELECT id, nome, especialidade, medico, data, horario FROM agendamentos"
-        cursor.execute(query)
-        agendamentos = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return jsonify(agendamentos)
-    except mysql.connector.Error as err:
+        # No primário: é para cá que o cliente do stream volta depois de um `reset`,
+        # e a lista precisa incluir tudo o que o feed já entregou
+        return jsonify(repositorio.listar_agendamentos(exigir_primario=True))
+    except ErroDeBanco as err:
+        return jsonify({"error": str(err)}), 500
+
+# --- Rota para consultar o histórico (consultas já realizadas) ---
+@app.route('/agendamentos/historico', methods=['GET'])
+def get_historico():
+    try:
+        limite = min(int(request.args.get('limite', 50)), 500)
+        deslocamento = int(request.args.get('deslocamento', 0))
+    except ValueError:
+        return jsonify({'error': 'Parâmetros de paginação inválidos.'}), 400
+    try:
+        consultas = repositorio.buscar_historico(termo_busca=request.args.get('busca'), limite=limite, deslocamento=deslocamento)
+        return jsonify(consultas)
+    except ErroDeBanco as err:
         return jsonify({"error": str(err)}), 500
 
 # --- Rota para agendar uma nova consulta ---
 @app.route('/agendar', methods=['POST'])
+@perfilador.perfilar('api.agendar_consulta')
 def agendar_consulta():
     try:
         # Recebe os dados JSON enviados pelo frontend
@@ -42,23 +81,25 @@ def agendar_consulta():
         if not dados or 'nome' not in dados or 'especialidade' not in dados or 'medico' not in dados or 'data' not in dados or 'horario' not in dados:
             return jsonify({'error': 'Dados incompletos para o agendamento.'}), 400
 
-        # Conecta ao banco de dados
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
+        # O médico é gravado pelo id do catálogo; o nome enviado pode ser parcial ou sem acentos
+        candidatos = catalogo.resolver_medico(dados['medico'], dados['especialidade'])
+        if len(candidatos) != 1:
+            nomes = [m['nome'] for m in candidatos]
+            return jsonify({'error': 'Médico não encontrado ou ambíguo.', 'candidatos': nomes}), 400
+        dados['medico_id'] = candidatos[0]['id']
+        dados['medico'] = candidatos[0]['nome']
 
-        # Insere o novo agendamento no banco de dados
-        query = "INSERT INTO agendamentos (nome, especialidade, medico, data, horario) VALUES (%s, %s, %s, %s, %s)"
-        values = (dados['nome'], dados['especialidade'], dados['medico'], dados['data'], dados['horario'])
-        cursor.execute(query, values)
-        conn.commit()
-        
-        # Fecha a conexão
-        cursor.close()
-        conn.close()
+        # Insere o novo agendamento no banco de dados (junto com o evento do feed)
+        repositorio.criar_agendamento(dados)
+        feed.notificar()
 
         return jsonify({"message": "Agendamento realizado com sucesso!", "dados": dados}), 201
 
-    except mysql.connector.Error as err:
+    except HorarioIndisponivel as err:
+        if err.motivo == 'indisponivel':
+            return jsonify({'error': f"{dados['medico']} não atende neste dia e horário.", 'motivo': err.motivo}), 409
+        return jsonify({'error': f"O horário das {dados['horario']} com {dados['medico']} já está ocupado.", 'motivo': err.motivo}), 409
+    except ErroDeBanco as err:
         # Retorna o erro específico do banco de dados
         print(f"Erro no agendamento: {err}")
         return jsonify({"error": str(err)}), 500
@@ -71,21 +112,70 @@ def agendar_consulta():
 @app.route('/cancelar/<int:id>', methods=['DELETE'])
 def cancelar_agendamento(id):
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        query = "DELETE FROM agendamentos WHERE id = %s"
-        cursor.execute(query, (id,))
-        conn.commit()
-        cursor.close()
-        conn.close()
+        repositorio.excluir_agendamento(id)
+        feed.notificar()
         return jsonify({"message": "Agendamento cancelado com sucesso."})
-    except mysql.connector.Error as err:
+    except ErroDeBanco as err:
         return jsonify({"error": str(err)}), 500
 
+# --- Rota de Server-Sent Events com as mudanças nos agendamentos ---
+@app.route('/agendamentos/stream')
+def stream_agendamentos():
+    garantir_acompanhamento()
+
+    # O navegador envia o Last-Event-ID ao reconectar; `ultimo_id` permite retomar manualmente
+    ultimo_id = request.headers.get('Last-Event-ID') or request.args.get('ultimo_id')
+    try:
+        ultimo_id = int(ultimo_id) if ultimo_id else None
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID inválido.'}), 400
+
+    assinante = feed.assinar(ultimo_id)
+
+    def gerar():
+        try:
+            yield "retry: 3000\n\n"
+            while not assinante.encerrado():
+                evento = assinante.proximo(timeout=15)
+                if evento is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield formatar_sse(evento)
+        finally:
+            # Também chega aqui quando a fila do cliente transborda: ele reconecta e retoma
+            feed.cancelar(assinante)
+
+    return Response(gerar(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# --- Rota de administração do profiling ---
+@app.route('/admin/perfil', methods=['GET', 'POST'])
+def admin_perfil():
+    # A API não tem login: a rota só existe com ADMIN_TOKEN definido e enviado no cabeçalho
+    if not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Não autorizado.'}), 403
+    if request.method == 'POST':
+        dados = request.get_json(silent=True) or {}
+        if not isinstance(dados, dict):
+            return jsonify({'error': 'Envie um objeto JSON com ativo, amostra e/ou resetar.'}), 400
+        try:
+            amostra = dados.get('amostra')
+            perfilador.configurar(ativo=dados.get('ativo'), amostra=float(amostra) if amostra is not None else None)
+        except (TypeError, ValueError) as err:
+            return jsonify({'error': str(err)}), 400
+        if como_booleano(dados.get('resetar')):
+            perfilador.resetar()
+    try:
+        n = int(request.args.get('n', 20))
+        return jsonify({'estado': perfilador.estado(), **perfilador.top(n, request.args.get('ordem', 'tottime'))})
+    except (KeyError, ValueError):
+        return jsonify({'error': "Use n inteiro e ordem 'tottime', 'cumtime' ou 'ncalls'."}), 400
+
 # --- Rota principal para servir o painel (index.html) ---
 @app.route('/')
 def index():
     return app.send_static_file('templates/index.html')
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    repositorio.criar_tabelas()
+    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
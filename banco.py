@@ -0,0 +1,135 @@
+import itertools
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def replicas_do_ambiente(primario, variavel='DB_REPLICAS'):
+    """Monta a configuração das réplicas a partir de DB_REPLICAS="host1,host2:3307".
+
+    Usuário, senha e banco são os mesmos do primário.
+    """
+    replicas = []
+    for endereco in filter(None, (e.strip() for e in os.getenv(variavel, '').split(','))):
+        host, _, porta = endereco.partition(':')
+        config = dict(primario, host=host)
+        if porta:
+            config['port'] = int(porta)
+        replicas.append(config)
+    return replicas
+
+
+def atraso_da_replica(conn):
+    """Segundos de atraso de uma réplica MySQL; None se a replicação estiver parada."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except Exception:
+            # MySQL anterior ao 8.0.22
+            cursor.execute("SHOW SLAVE STATUS")
+        status = cursor.fetchone()
+    finally:
+        cursor.close()
+    if not status:
+        return None
+    return status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+
+
+class RoteadorDeConexoes:
+    """Envia escritas ao primário e leituras que toleram atraso às réplicas.
+
+    As réplicas são usadas em rodízio (round-robin). Uma réplica que falha ao
+    conectar fica em quarentena por `tempo_de_quarentena` segundos e a leitura
+    tenta a próxima; sem réplicas saudáveis, a leitura vai para o primário.
+
+    Com `atraso_maximo` (segundos), o atraso de cada réplica é medido com
+    `medir_atraso(conexao)` no máximo uma vez a cada `intervalo_de_verificacao`
+    segundos; a réplica atrasada além do limite, ou com a replicação parada
+    (None), também vai para a quarentena.
+
+    `conectar` recebe a configuração como kwargs; o padrão é o
+    `mysql.connector.connect`, importado só quando o roteador é criado.
+    """
+
+    def __init__(self, primario, replicas=(), conectar=None, tempo_de_quarentena=30,
+                 atraso_maximo=None, medir_atraso=atraso_da_replica, intervalo_de_verificacao=5,
+                 relogio=time.monotonic):
+        if conectar is None:
+            import mysql.connector
+            conectar = mysql.connector.connect
+        self.primario = primario
+        self.replicas = list(replicas)
+        self.tempo_de_quarentena = tempo_de_quarentena
+        self.atraso_maximo = atraso_maximo
+        self.intervalo_de_verificacao = intervalo_de_verificacao
+        self._conectar = conectar
+        self._medir_atraso = medir_atraso
+        self._relogio = relogio
+        self._lock = threading.Lock()
+        self._rodizio = itertools.cycle(range(len(self.replicas))) if self.replicas else None
+        self._quarentena = {}
+        self._verificada_em = {}
+
+    def escrita(self):
+        """Conexão com o primário: escritas e leituras que precisam ver a última escrita."""
+        return self._conectar(**self.primario)
+
+    def _proximas_replicas(self):
+        """Índices das réplicas fora de quarentena, começando pela vez do rodízio."""
+        with self._lock:
+            agora = self._relogio()
+            inicio = next(self._rodizio)
+            ordem = [(inicio + i) % len(self.replicas) for i in range(len(self.replicas))]
+            return [i for i in ordem if self._quarentena.get(i, 0) <= agora]
+
+    def leitura(self, exigir_primario=False):
+        """Conexão para leituras que aceitam dados levemente desatualizados."""
+        if exigir_primario or not self.replicas:
+            return self.escrita()
+        for indice in self._proximas_replicas():
+            try:
+                conn = self._conectar(**self.replicas[indice])
+            except Exception as err:
+                self._isolar(indice, f"indisponível: {err}")
+                continue
+            if self._atrasada(indice, conn):
+                conn.close()
+                continue
+            return conn
+        return self.escrita()
+
+    def _atrasada(self, indice, conn):
+        """Mede o atraso da réplica (se já não foi medido há pouco); True a coloca em quarentena."""
+        if self.atraso_maximo is None:
+            return False
+        agora = self._relogio()
+        with self._lock:
+            verificada_em = self._verificada_em.get(indice)
+        if verificada_em is not None and agora - verificada_em < self.intervalo_de_verificacao:
+            return False
+        try:
+            atraso = self._medir_atraso(conn)
+        except Exception as err:
+            self._isolar(indice, f"sem status de replicação: {err}")
+            return True
+        if atraso is None or atraso > self.atraso_maximo:
+            motivo = 'replicação parada' if atraso is None else f"{atraso}s atrasada"
+            self._isolar(indice, motivo)
+            return True
+        with self._lock:
+            self._verificada_em[indice] = agora
+        return False
+
+    def _isolar(self, indice, motivo):
+        logger.warning(f"Réplica {self.replicas[indice].get('host')} em quarentena: {motivo}")
+        with self._lock:
+            self._quarentena[indice] = self._relogio() + self.tempo_de_quarentena
+            self._verificada_em.pop(indice, None)
+
+    def replicas_saudaveis(self):
+        agora = self._relogio()
+        return [r.get('host') for i, r in enumerate(self.replicas) if self._quarentena.get(i, 0) <= agora]
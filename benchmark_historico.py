@@ -0,0 +1,177 @@
+"""Benchmark das consultas quentes e do arquivamento com a tabela cheia.
+
+Popula um banco descartável com --linhas agendamentos (10 milhões por padrão,
+parte deles antes de hoje), mede as consultas do dia a dia de bot, API e
+painel, mostra o plano da busca usada pelo arquivamento e cronometra
+`arquivar_passados`; depois mede de novo, já com a tabela quente enxuta.
+
+O backend vem de CLINICA_BACKEND. Com sqlite, o arquivo de --sqlite é apagado
+e recriado. Com mysql, usa as variáveis DB_* e exige DB_DATABASE explícito:
+as tabelas de agendamentos desse banco são esvaziadas.
+
+Exemplo:
+    CLINICA_BACKEND=sqlite python benchmark_historico.py --linhas 10000000
+"""
+import argparse
+import os
+import random
+import time
+from datetime import date, timedelta
+
+from repositorio import DIAS_DA_SEMANA, RepositorioMySQL, RepositorioSQLite
+
+MEDICOS = 50
+HORARIOS = [f'{h:02d}:{m:02d}' for h in range(8, 18) for m in (0, 30)]
+# Leem a tabela quente inteira (painel e GET /agendamentos): poucas execuções bastam
+VARREDURAS = ('listar_agendamentos', 'listar_agendamentos_busca')
+
+
+def criar_repositorio(args):
+    if os.getenv('CLINICA_BACKEND', 'mysql').lower() == 'sqlite':
+        for sufixo in ('', '-wal', '-shm'):
+            if os.path.exists(args.sqlite + sufixo):
+                os.remove(args.sqlite + sufixo)
+        repositorio = RepositorioSQLite(args.sqlite)
+        repositorio.criar_tabelas()
+        return repositorio
+    if not os.getenv('DB_DATABASE'):
+        raise SystemExit('Defina DB_DATABASE com um banco descartável: as tabelas de agendamentos serão esvaziadas.')
+    repositorio = RepositorioMySQL({
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'user': os.getenv('DB_USER', 'root'),
+        'password': os.getenv('DB_PASSWORD'),
+        'database': os.getenv('DB_DATABASE')
+    }, replicas=[])
+    repositorio.criar_tabelas()
+    with repositorio._transacao() as cursor:
+        cursor.execute("TRUNCATE TABLE agendamentos")
+        cursor.execute("TRUNCATE TABLE agendamentos_historico")
+    return repositorio
+
+
+def cadastrar_medicos(repositorio):
+    """Médicos que atendem todos os dias, das 08:00 às 18:00; retorna {id: nome}."""
+    medicos = {}
+    for n in range(1, MEDICOS + 1):
+        nome = f'Dr. Benchmark {n:02d}'
+        for dia in DIAS_DA_SEMANA.values():
+            medico_id = repositorio.adicionar_medico(nome, dia, '08:00', '18:00', 'Cardiologia')
+        medicos[medico_id] = nome
+    return medicos
+
+
+def popular(repositorio, linhas, passadas, medicos, lote=50_000, dias=730):
+    """Insere `linhas` agendamentos espalhados por `dias` dias antes e depois de hoje."""
+    aleatorio = random.Random(42)
+    hoje = date.today()
+    ids_medicos = list(medicos)
+    usuarios = max(1, linhas // 5)
+    query = repositorio._sql("""
+        INSERT INTO agendamentos (nome, especialidade, data, horario, medico, medico_id, user_id, data_consulta)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """)
+    inicio = time.perf_counter()
+    for comeco in range(0, linhas, lote):
+        valores = []
+        for _ in range(min(lote, linhas - comeco)):
+            deslocamento = -aleatorio.randint(1, dias) if aleatorio.random() < passadas else aleatorio.randint(0, dias)
+            dia = hoje + timedelta(days=deslocamento)
+            medico_id = aleatorio.choice(ids_medicos)
+            user_id = aleatorio.randint(1, usuarios)
+            valores.append((f'Paciente {user_id}', 'Cardiologia', dia.strftime('%d/%m/%Y'), aleatorio.choice(HORARIOS),
+                            medicos[medico_id], medico_id, user_id, dia.isoformat()))
+        with repositorio._transacao() as cursor:
+            cursor.executemany(query, valores)
+        feitas = comeco + len(valores)
+        if feitas % (lote * 20) == 0 or feitas == linhas:
+            print(f"  {feitas:>12,} linhas ({time.perf_counter() - inicio:.0f}s)")
+    return time.perf_counter() - inicio
+
+
+def percentil(valores_ordenados, p):
+    indice = min(len(valores_ordenados) - 1, int(round(p / 100 * (len(valores_ordenados) - 1))))
+    return valores_ordenados[indice]
+
+
+def medir(consultas, repeticoes, repeticoes_varredura):
+    print(f"{'consulta':<28}{'n':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'máx ms':>10}")
+    for nome, funcao in consultas.items():
+        tempos = []
+        for _ in range(min(repeticoes, repeticoes_varredura) if nome in VARREDURAS else repeticoes):
+            inicio = time.perf_counter()
+            funcao()
+            tempos.append(time.perf_counter() - inicio)
+        tempos.sort()
+        print(f"{nome:<28}{len(tempos):>6}"
+              f"{percentil(tempos, 50) * 1000:>10.2f}{percentil(tempos, 90) * 1000:>10.2f}"
+              f"{percentil(tempos, 99) * 1000:>10.2f}{tempos[-1] * 1000:>10.2f}")
+
+
+def consultas_quentes(repositorio, medicos, linhas, historico=False):
+    aleatorio = random.Random(7)
+    ids_medicos = list(medicos)
+    usuarios = max(1, linhas // 5)
+
+    def data_futura():
+        return (date.today() + timedelta(days=aleatorio.randint(0, 730))).strftime('%d/%m/%Y')
+
+    consultas = {
+        'verificar_disponibilidade': lambda: repositorio.verificar_disponibilidade(
+            aleatorio.choice(ids_medicos), data_futura(), aleatorio.choice(HORARIOS)),
+        'consultas_do_usuario': lambda: repositorio.consultas_do_usuario(aleatorio.randint(1, usuarios)),
+        'buscar_agendamento': lambda: repositorio.buscar_agendamento(aleatorio.randint(1, linhas)),
+        'nome_do_usuario': lambda: repositorio.nome_do_usuario(aleatorio.randint(1, usuarios)),
+        'consultas_para_lembrete': lambda: repositorio.consultas_para_lembrete(data_futura()),
+        'listar_agendamentos': lambda: repositorio.listar_agendamentos(),
+        'listar_agendamentos_busca': lambda: repositorio.listar_agendamentos(f'Paciente {aleatorio.randint(1, usuarios)}'),
+    }
+    if historico:
+        consultas['buscar_historico'] = lambda: repositorio.buscar_historico(user_id=aleatorio.randint(1, usuarios))
+    return consultas
+
+
+def mostrar_plano(repositorio):
+    """Plano da busca de cada lote do arquivamento: precisa ser uma faixa no índice de data_consulta."""
+    query = f"SELECT id FROM agendamentos WHERE data_consulta < {repositorio._hoje()} LIMIT 1000"
+    explain = 'EXPLAIN QUERY PLAN ' if isinstance(repositorio, RepositorioSQLite) else 'EXPLAIN '
+    with repositorio._leitura(exigir_primario=True) as cursor:
+        cursor.execute(explain + query)
+        for linha in cursor.fetchall():
+            print('  ' + ' | '.join(f"{chave}={valor}" for chave, valor in linha.items() if valor is not None))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark das consultas quentes e do arquivamento.')
+    parser.add_argument('--linhas', type=int, default=10_000_000, help='agendamentos a inserir')
+    parser.add_argument('--passadas', type=float, default=0.5, help='fração dos agendamentos antes de hoje')
+    parser.add_argument('--lote', type=int, default=1000, help='tamanho do lote do arquivamento')
+    parser.add_argument('--repeticoes', type=int, default=200, help='execuções de cada consulta')
+    parser.add_argument('--repeticoes-varredura', type=int, default=3,
+                        help='execuções das listagens, que carregam a tabela quente inteira em memória')
+    parser.add_argument('--sqlite', default='benchmark_clinica.db', help='arquivo do banco com CLINICA_BACKEND=sqlite')
+    args = parser.parse_args()
+
+    repositorio = criar_repositorio(args)
+    medicos = cadastrar_medicos(repositorio)
+    print(f"Inserindo {args.linhas:,} agendamentos ({args.passadas:.0%} antes de hoje)...")
+    duracao = popular(repositorio, args.linhas, args.passadas, medicos)
+    print(f"Carga: {duracao:.1f}s ({args.linhas / duracao:,.0f} linhas/s)\n")
+
+    print(f"Consultas com {args.linhas:,} linhas na tabela quente:")
+    medir(consultas_quentes(repositorio, medicos, args.linhas), args.repeticoes, args.repeticoes_varredura)
+
+    print("\nPlano da busca do arquivamento:")
+    mostrar_plano(repositorio)
+
+    inicio = time.perf_counter()
+    movidas = repositorio.arquivar_passados(lote=args.lote)
+    duracao = time.perf_counter() - inicio
+    print(f"\nArquivamento: {movidas:,} consultas em {duracao:.1f}s "
+          f"({movidas / duracao if duracao else 0:,.0f} linhas/s, lotes de {args.lote})\n")
+
+    print("Consultas depois do arquivamento:")
+    medir(consultas_quentes(repositorio, medicos, args.linhas, historico=True), args.repeticoes, args.repeticoes_varredura)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,3 @@
-import mysql.connector
 import logging
 import smtplib
 from email.mime.text import MIMEText
@@ -11,6 +10,11 @@ from sklearn.pipeline import Pipeline
 import locale
 import os
 from dotenv import load_dotenv
+from limitador import ControleDeFluxo
+from catalogo import Catalogo, normalizar
+from repositorio import obter_repositorio, dia_da_semana, ErroDeBanco, HorarioIndisponivel, ESPECIALIDADES_PADRAO
+from perfilador import Perfilador
+import time
 
 # Carrega as variáveis do arquivo .env
 load_dotenv()
@@ -40,6 +44,52 @@ DB_CONFIG = {
     'database': os.getenv('DB_DATABASE', 'clinica_bot')
 }
 
+# --- Banco de Dados (CLINICA_BACKEND=mysql|sqlite) ---
+# No MySQL, leituras que toleram atraso (saudação, minhas consultas, lembretes) vão
+# para as réplicas de DB_REPLICAS; escritas e as validações antes do INSERT, para o primário.
+repositorio = obter_repositorio(DB_CONFIG)
+
+# Usuários que escreveram há pouco leem do primário para ver a própria alteração
+JANELA_LEITURA_PRIMARIO = 10
+ultimas_escritas = {}
+
+def registrar_escrita(user_id):
+    agora = time.monotonic()
+    # Reinserido no fim: o dicionário fica em ordem de escrita e os expirados saem pelo começo
+    ultimas_escritas.pop(user_id, None)
+    ultimas_escritas[user_id] = agora
+    antigo = next(iter(ultimas_escritas))
+    while agora - ultimas_escritas[antigo] >= JANELA_LEITURA_PRIMARIO:
+        del ultimas_escritas[antigo]
+        antigo = next(iter(ultimas_escritas))
+
+def escreveu_recentemente(user_id):
+    escreveu_em = ultimas_escritas.get(user_id)
+    if escreveu_em is None:
+        return False
+    if time.monotonic() - escreveu_em >= JANELA_LEITURA_PRIMARIO:
+        ultimas_escritas.pop(user_id, None)
+        return False
+    return True
+
+# --- Profiling por amostragem (PERFIL_ATIVO=1, PERFIL_AMOSTRA=0.1) ---
+perfilador = Perfilador.do_ambiente()
+
+# --- Catálogo de Médicos e Especialidades ---
+catalogo = Catalogo(repositorio)
+
+# --- Controle de Fluxo (proteção contra flood) ---
+controle_de_fluxo = ControleDeFluxo(
+    taxa_usuario=float(os.getenv('FLUXO_TAXA_USUARIO', '1')),
+    rajada_usuario=int(os.getenv('FLUXO_RAJADA_USUARIO', '5')),
+    taxa_global=float(os.getenv('FLUXO_TAXA_GLOBAL', '30')),
+    rajada_global=int(os.getenv('FLUXO_RAJADA_GLOBAL', '60')),
+    atraso_maximo=float(os.getenv('FLUXO_ATRASO_MAXIMO', '2')),
+    max_concorrentes=int(os.getenv('FLUXO_MAX_CONCORRENTES', '20')),
+    max_fila=int(os.getenv('FLUXO_MAX_FILA', '200'))
+)
+MENSAGEM_SOBRECARGA = 'Estamos recebendo muitas mensagens no momento. Por favor, tente novamente em alguns segundos.'
+
 # --- Dicionários para Armazenar Dados (Temporário) ---
 conversas_em_andamento = {}
 
@@ -60,6 +110,23 @@ def validar_horario(horario_str):
     except ValueError:
         return False
 
+def especialidades_disponiveis():
+    """Especialidades do catálogo; sem banco na primeira carga, a lista padrão da clínica."""
+    try:
+        return catalogo.especialidades()
+    except ErroDeBanco as err:
+        logger.error(f"Erro ao carregar as especialidades: {err}")
+        return list(ESPECIALIDADES_PADRAO)
+
+def especialidade_valida(texto):
+    """Nome oficial da especialidade digitada ou None (com a mesma lista padrão sem banco)."""
+    try:
+        return catalogo.especialidade_valida(texto)
+    except ErroDeBanco as err:
+        logger.error(f"Erro ao carregar as especialidades: {err}")
+        padrao = {normalizar(especialidade): especialidade for especialidade in ESPECIALIDADES_PADRAO}
+        return padrao.get(normalizar(texto))
+
 # --- Funções do Chatbot ---
 def enviar_email(assunto, corpo):
     try:
@@ -97,17 +164,12 @@ nlp_model = Pipeline([
 nlp_model.fit(X_train, y_train)
 
 # --- Funções de Gestão de Agendamentos ---
+@perfilador.perfilar('bot.minhas_consultas')
 async def minhas_consultas(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Lista todas as consultas do usuário."""
     user_id = update.effective_user.id
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor(dictionary=True)
-        query = "SELECT id, especialidade, data, horario, medico FROM agendamentos WHERE user_id = %s"
-        cursor.execute(query, (user_id,))
-        consultas = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        consultas = repositorio.consultas_do_usuario(user_id, exigir_primario=escreveu_recentemente(user_id))
 
         if not consultas:
             await update.message.reply_text('Você não tem nenhuma consulta agendada.')
@@ -123,7 +185,7 @@ async def minhas_consultas(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         response_text += "Use o comando `/cancelar [ID]` para cancelar uma consulta. Ex: `/cancelar 123`"
         await update.message.reply_text(response_text)
-    except mysql.connector.Error as err:
+    except ErroDeBanco as err:
         await update.message.reply_text(f"Ocorreu um erro ao buscar suas consultas. Erro: {err}")
 
 async def cancelar(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -146,22 +208,14 @@ async def cancelar(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def processar_cancelamento(update: Update, context: ContextTypes.DEFAULT_TYPE, consulta_id, user_id):
     """Lida com a lógica de cancelamento no banco de dados."""
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor(dictionary=True)
-        
-        query_select = "SELECT * FROM agendamentos WHERE id = %s AND user_id = %s"
-        cursor.execute(query_select, (consulta_id, user_id))
-        consulta = cursor.fetchone()
+        # Só exclui se a consulta pertencer ao usuário
+        consulta = repositorio.excluir_agendamento(consulta_id, user_id=user_id)
 
         if not consulta:
             await update.message.reply_text(f"Nenhuma consulta encontrada com o ID `{consulta_id}`.")
-            cursor.close()
-            conn.close()
             return
 
-        query_delete = "DELETE FROM agendamentos WHERE id = %s"
-        cursor.execute(query_delete, (consulta_id,))
-        conn.commit()
+        registrar_escrita(user_id)
 
         assunto_email = f"Agendamento Cancelado: {consulta['nome']}"
         corpo_email = f"""
@@ -182,17 +236,14 @@ async def processar_cancelamento(update: Update, context: ContextTypes.DEFAULT_T
             f"Sua consulta de {consulta['especialidade']} com Dr(a). {consulta['medico']} foi cancelada com sucesso."
         )
 
-    except mysql.connector.Error as err:
+    except ErroDeBanco as err:
         await update.message.reply_text(f"Ocorreu um erro ao cancelar a consulta. Erro: {err}")
     finally:
         if 'etapa' in conversas_em_andamento.get(user_id, {}):
             del conversas_em_andamento[user_id]
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
 
 # --- Funções do Chatbot (Resto do Código) ---
+@perfilador.perfilar('bot.start')
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Responde ao comando /start com saudação personalizada e botões relevantes."""
     user_id = update.effective_user.id
@@ -200,19 +251,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_name = None
     has_appointments = False
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor(dictionary=True)
-        
-        query = "SELECT nome FROM agendamentos WHERE user_id = %s LIMIT 1"
-        cursor.execute(query, (user_id,))
-        result = cursor.fetchone()
-        if result:
-            user_name = result['nome'].split()[0]
+        nome = repositorio.nome_do_usuario(user_id, exigir_primario=escreveu_recentemente(user_id))
+        if nome:
+            user_name = nome.split()[0]
             has_appointments = True
-            
-        cursor.close()
-        conn.close()
-    except mysql.connector.Error as err:
+    except ErroDeBanco as err:
         logger.error(f"Erro ao buscar usuário no banco de dados: {err}")
 
     if user_name:
@@ -245,7 +288,7 @@ async def agendar(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     conversas_em_andamento[user_id] = {'etapa': 'especialidade'}
     
-    especialidades_keyboard = [['Cardiologia'], ['Dermatologia'], ['Ginecologia'], ['Pediatria']]
+    especialidades_keyboard = [[especialidade] for especialidade in especialidades_disponiveis()]
     reply_markup = ReplyKeyboardMarkup(especialidades_keyboard, one_time_keyboard=True)
     
     await update.message.reply_text(
@@ -253,14 +296,14 @@ async def agendar(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=reply_markup
     )
         
+@perfilador.perfilar('bot.handle_agendamento')
 async def handle_agendamento(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     etapa_atual = conversas_em_andamento[user_id]['etapa']
     
     if etapa_atual == 'especialidade':
-        especialidade = update.message.text
-        especialidades_validas = ['Cardiologia', 'Dermatologia', 'Ginecologia', 'Pediatria']
-        if especialidade not in especialidades_validas:
+        especialidade = especialidade_valida(update.message.text)
+        if not especialidade:
             await update.message.reply_text('Por favor, escolha uma especialidade da lista ou digite o nome corretamente.')
             return
         conversas_em_andamento[user_id]['especialidade'] = especialidade
@@ -287,78 +330,56 @@ async def handle_agendamento(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text(f'Horário registrado: {horario}. Para qual médico você deseja agendar?')
 
     elif etapa_atual == 'medico':
-        medico_completo = update.message.text
-        # Remove os prefixos "Dr." e "Dra." e limpa espaços e caracteres de nova linha
-        medico_limpo = medico_completo.replace("Dr.", "").replace("Dr.", "").replace("Dra.", "").replace("Dra.", "").strip().replace('\n', '').replace('\r', '')
-        # Extrai apenas o primeiro nome para a consulta
-        medico_limpo = medico_limpo.split()[0]
+        # O resolvedor ignora acentos, caixa e os prefixos "Dr."/"Dra." e aceita nomes parciais
+        try:
+            candidatos = catalogo.resolver_medico(update.message.text, conversas_em_andamento[user_id]['especialidade'])
+        except ErroDeBanco as err:
+            logger.error(f"Erro ao carregar o catálogo de médicos: {err}")
+            await update.message.reply_text('Não foi possível consultar os médicos agora. Por favor, tente novamente em instantes.')
+            return
+        if not candidatos:
+            await update.message.reply_text('Não encontramos esse médico. Por favor, verifique o nome e tente novamente.')
+            return
+        if len(candidatos) > 1:
+            nomes = ', '.join(m['nome'] for m in candidatos[:5])
+            await update.message.reply_text(f'Encontramos mais de um médico com esse nome: {nomes}. Por favor, seja mais específico.')
+            return
+        medico_id = candidatos[0]['id']
+        medico_completo = candidatos[0]['nome']
+        conversas_em_andamento[user_id]['medico_id'] = medico_id
         conversas_em_andamento[user_id]['medico'] = medico_completo
         
         data = conversas_em_andamento[user_id]['data']
         horario = conversas_em_andamento[user_id]['horario']
         
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor()
-
-            # Mapeamento manual dos dias da semana para evitar erros de locale
-            dias_da_semana = {
-                0: 'Segunda-feira',
-                1: 'Terça-feira',
-                2: 'Quarta-feira',
-                3: 'Quinta-feira',
-                4: 'Sexta-feira',
-                5: 'Sábado',
-                6: 'Domingo'
-            }
-            dia_da_semana_num = datetime.strptime(data, '%d/%m/%Y').weekday()
-            dia_da_semana_pt = dias_da_semana.get(dia_da_semana_num)
-
-            # 1. Validação do horário de trabalho do médico (versão final e mais robusta)
-            # A consulta usa a versão "limpa" do nome do médico para evitar conflitos de formatação
-            query_disponibilidade = """
-                SELECT * FROM medico_disponibilidade
-                WHERE medico_nome = %s
-                  AND dia_da_semana = %s
-                  AND horario_inicio <= %s AND horario_fim >= %s
-            """
-            
-            logger.info(f"Executando query com: Médico='{medico_limpo}', Dia='{dia_da_semana_pt}', Horário='{horario}'")
-            
-            cursor.execute(query_disponibilidade, (medico_limpo, dia_da_semana_pt, horario, horario))
-            if not cursor.fetchone():
-                await update.message.reply_text(
-                    f"{medico_completo} não atende na {dia_da_semana_pt} neste horário. "
-                    "Por favor, tente outro horário ou outro dia."
-                )
-                cursor.close()
-                conn.close()
-                conversas_em_andamento[user_id]['etapa'] = 'medico'
-                return
-
-            # 2. Validação de agendamento duplicado
-            query_check = "SELECT * FROM agendamentos WHERE data = %s AND horario = %s AND medico = %s"
-            cursor.execute(query_check, (data, horario, medico_completo))
-            if cursor.fetchone():
-                await update.message.reply_text(
-                    f"O horário das {horario} com {medico_completo} já está ocupado. "
-                    "Por favor, tente outro horário ou data."
-                )
-                cursor.close()
-                conn.close()
-                conversas_em_andamento[user_id]['etapa'] = 'medico'
-                return
-            
-            cursor.close()
-            conn.close()
-            
-        except mysql.connector.Error as err:
+            logger.info(f"Verificando disponibilidade: Médico={medico_id}, Data='{data}', Horário='{horario}'")
+            motivo = repositorio.verificar_disponibilidade(medico_id, data, horario)
+        except ErroDeBanco as err:
             await update.message.reply_text(
                 f"Ocorreu um erro ao verificar a disponibilidade. Por favor, tente novamente. Erro: {err}"
             )
             del conversas_em_andamento[user_id]
             return
 
+        # 1. Validação do horário de trabalho do médico (pelo id do catálogo)
+        if motivo == 'indisponivel':
+            await update.message.reply_text(
+                f"{medico_completo} não atende na {dia_da_semana(data)} neste horário. "
+                "Por favor, tente outro horário ou outro dia."
+            )
+            conversas_em_andamento[user_id]['etapa'] = 'medico'
+            return
+
+        # 2. Validação de agendamento duplicado
+        if motivo == 'ocupado':
+            await update.message.reply_text(
+                f"O horário das {horario} com {medico_completo} já está ocupado. "
+                "Por favor, tente outro horário ou data."
+            )
+            conversas_em_andamento[user_id]['etapa'] = 'medico'
+            return
+
         # Se as duas validações passarem, avança para a próxima etapa
         conversas_em_andamento[user_id]['etapa'] = 'nome'
         await update.message.reply_text(f'Certo, {medico_completo}. Agora, por favor, informe seu nome completo para finalizar o agendamento.')
@@ -368,17 +389,15 @@ async def handle_agendamento(update: Update, context: ContextTypes.DEFAULT_TYPE)
         especialidade = conversas_em_andamento[user_id]['especialidade']
         data = conversas_em_andamento[user_id]['data']
         horario = conversas_em_andamento[user_id]['horario']
+        medico_id = conversas_em_andamento[user_id]['medico_id']
         medico_completo = conversas_em_andamento[user_id]['medico']
         
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor()
-            query = "INSERT INTO agendamentos (nome, especialidade, data, horario, medico, user_id) VALUES (%s, %s, %s, %s, %s, %s)"
-            values = (nome, especialidade, data, horario, medico_completo, user_id)
-            cursor.execute(query, values)
-            conn.commit()
-            cursor.close()
-            conn.close()
+            repositorio.criar_agendamento({
+                'nome': nome, 'especialidade': especialidade, 'data': data, 'horario': horario,
+                'medico': medico_completo, 'medico_id': medico_id, 'user_id': user_id
+            })
+            registrar_escrita(user_id)
 
             assunto_email = f"Novo Agendamento: {nome}"
             corpo_email = f"""
@@ -400,7 +419,14 @@ async def handle_agendamento(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 f'marcada para o dia {data}, às {horario}.',
                 reply_markup=ReplyKeyboardRemove()
             )
-        except mysql.connector.Error as err:
+        except HorarioIndisponivel:
+            # Outro paciente (ou o painel) ficou com o horário depois da verificação da etapa 'medico'
+            await update.message.reply_text(
+                f"Que pena, o horário das {horario} de {data} com {medico_completo} acabou de ser ocupado. "
+                "Use /agendar para escolher outro horário.",
+                reply_markup=ReplyKeyboardRemove()
+            )
+        except ErroDeBanco as err:
             await update.message.reply_text(f"Ocorreu um erro ao agendar a consulta. Por favor, tente novamente mais tarde. Erro: {err}")
         
         del conversas_em_andamento[user_id]
@@ -412,6 +438,7 @@ async def handle_agendamento(update: Update, context: ContextTypes.DEFAULT_TYPE)
         except ValueError:
             await update.message.reply_text("Entrada inválida. Por favor, digite apenas o número de ID da consulta.")
 
+@perfilador.perfilar('bot.faq_nlp')
 async def faq_nlp(update: Update, context: ContextTypes.DEFAULT_TYPE):
     pergunta = update.message.text
     intencao = nlp_model.predict([pergunta])[0]
@@ -419,7 +446,9 @@ async def faq_nlp(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if intencao == 'horario':
         await update.message.reply_text('Nosso horário de funcionamento é de segunda a sexta, das 8h às 18h.')
     elif intencao == 'especialidade':
-        await update.message.reply_text('Oferecemos as seguintes especialidades: Cardiologia, Dermatologia, Ginecologia e Pediatria.')
+        especialidades = especialidades_disponiveis()
+        lista = ', '.join(especialidades[:-1]) + ' e ' + especialidades[-1] if len(especialidades) > 1 else ''.join(especialidades)
+        await update.message.reply_text(f'Oferecemos as seguintes especialidades: {lista}.')
     elif intencao == 'plano_saude':
         await update.message.reply_text('Aceitamos os planos de saúde Unimed, SulAmérica e Bradesco Saúde.')
     else:
@@ -447,13 +476,7 @@ async def check_and_send_reminders(context: ContextTypes.DEFAULT_TYPE):
     tomorrow = (datetime.now() + timedelta(days=1)).strftime('%d/%m/%Y')
     
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor(dictionary=True)
-        query = "SELECT user_id, especialidade, data, horario, medico FROM agendamentos WHERE data = %s"
-        cursor.execute(query, (tomorrow,))
-        consultas = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        consultas = repositorio.consultas_para_lembrete(tomorrow)
 
         if not consultas:
             logger.info("Nenhuma consulta encontrada para amanhã.")
@@ -473,28 +496,65 @@ async def check_and_send_reminders(context: ContextTypes.DEFAULT_TYPE):
             except Exception as e:
                 logger.error(f"Não foi possível enviar mensagem para o usuário {consulta['user_id']}: {e}")
 
-    except mysql.connector.Error as err:
+    except ErroDeBanco as err:
         logger.error(f"Erro no banco de dados durante a verificação de lembretes: {err}")
 
+async def arquivar_consultas_passadas(context: ContextTypes.DEFAULT_TYPE):
+    """Move as consultas anteriores a hoje para o histórico e apaga os eventos antigos do feed."""
+    try:
+        movidas = repositorio.arquivar_passados()
+        logger.info(f"{movidas} consultas passadas movidas para o histórico.")
+        podados = repositorio.podar_eventos()
+        logger.info(f"{podados} eventos antigos do feed de agendamentos apagados.")
+    except ErroDeBanco as err:
+        logger.error(f"Erro no banco de dados ao arquivar consultas passadas: {err}")
+
+async def registrar_estatisticas_de_fluxo(context: ContextTypes.DEFAULT_TYPE):
+    """Registra no log as mensagens processadas, atrasadas e descartadas pelo controle de fluxo."""
+    logger.info(f"Controle de fluxo: {controle_de_fluxo.estatisticas()}")
+
+async def registrar_perfil(context: ContextTypes.DEFAULT_TYPE):
+    """Publica no log as funções mais custosas das chamadas perfiladas."""
+    if perfilador.ativo:
+        logger.info(f"Top funções perfiladas: {perfilador.top(10)}")
+
 # --- Configuração e Inicialização do Bot ---
 def start_and_register_commands(application):
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("agendar", agendar))
-    application.add_handler(CommandHandler("minhas_consultas", minhas_consultas))
-    application.add_handler(CommandHandler("cancelar", cancelar))
-    application.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), handle_message))
+    # Comandos e mensagens passam pelo mesmo controle de fluxo: os comandos também
+    # consultam o banco, e o lock por usuário mantém a ordem entre comandos e
+    # mensagens de um chat mesmo com concurrent_updates ligado.
+    comandos = {
+        "start": start,
+        "help": help_command,
+        "agendar": agendar,
+        "minhas_consultas": minhas_consultas,
+        "cancelar": cancelar,
+    }
+    for comando, handler in comandos.items():
+        application.add_handler(CommandHandler(comando, controle_de_fluxo.proteger(handler, MENSAGEM_SOBRECARGA)))
+    application.add_handler(MessageHandler(
+        filters.TEXT & (~filters.COMMAND),
+        controle_de_fluxo.proteger(handle_message, MENSAGEM_SOBRECARGA)
+    ))
 
 def main():
-    if not TOKEN or not DB_CONFIG['password'] or not EMAIL_SENDER or not EMAIL_PASSWORD:
+    # A senha do banco só é exigida no MySQL; o SQLite é um arquivo local
+    senha_ausente = os.getenv('CLINICA_BACKEND', 'mysql').lower() == 'mysql' and not DB_CONFIG['password']
+    if not TOKEN or senha_ausente or not EMAIL_SENDER or not EMAIL_PASSWORD:
         logger.error("ERRO: Credenciais de ambiente não configuradas. Por favor, verifique o arquivo .env.")
         return
+
+    repositorio.criar_tabelas()
     
-    application = ApplicationBuilder().token(TOKEN).build()
+    # Atualizações concorrentes: o controle de fluxo limita a concorrência e mantém a ordem por usuário
+    application = ApplicationBuilder().token(TOKEN).concurrent_updates(True).build()
     start_and_register_commands(application)
 
     job_queue = application.job_queue
     job_queue.run_daily(check_and_send_reminders, time=datetime.strptime('00:00:00', '%H:%M:%S').time())
+    job_queue.run_daily(arquivar_consultas_passadas, time=datetime.strptime('00:05:00', '%H:%M:%S').time())
+    job_queue.run_repeating(registrar_estatisticas_de_fluxo, interval=300)
+    job_queue.run_repeating(registrar_perfil, interval=300)
 
     logger.info("Bot rodando...")
     application.run_polling()
@@ -0,0 +1,133 @@
+import bisect
+import logging
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+PREFIXOS_MEDICO = {'dr', 'dra', 'doutor', 'doutora'}
+
+
+def normalizar(texto):
+    """Minúsculas, sem acentos e sem pontuação: 'Dra. Júlia' -> 'dra julia'."""
+    sem_acentos = unicodedata.normalize('NFKD', texto)
+    sem_acentos = ''.join(c for c in sem_acentos if not unicodedata.combining(c))
+    limpo = ''.join(c if c.isalnum() else ' ' for c in sem_acentos.lower())
+    return ' '.join(limpo.split())
+
+
+def tokens_do_nome(nome):
+    """Tokens do nome de um médico, sem os prefixos 'Dr.', 'Dra.' etc."""
+    return [t for t in normalizar(nome).split() if t not in PREFIXOS_MEDICO]
+
+
+# --- Índice em Memória ---
+class _Indice:
+    """Foto imutável do catálogo; é trocada por inteiro a cada recarga."""
+
+    def __init__(self, especialidades, medicos):
+        self.especialidades = especialidades
+        self.especialidades_por_nome = {normalizar(e['nome']): e for e in especialidades}
+        self.medicos = {m['id']: m for m in medicos}
+        # Lista ordenada de (token, id) para buscas por prefixo com bisect
+        self.tokens = sorted((token, m['id']) for m in medicos for token in set(tokens_do_nome(m['nome'])))
+
+    def ids_com_prefixo(self, prefixo):
+        inicio = bisect.bisect_left(self.tokens, (prefixo,))
+        ids = set()
+        for token, medico_id in self.tokens[inicio:]:
+            if not token.startswith(prefixo):
+                break
+            ids.add(medico_id)
+        return ids
+
+
+class Catalogo:
+    """Médicos e especialidades em memória, recarregados quando o banco muda.
+
+    A cada `intervalo_verificacao` segundos uma consulta leve (contagem e último
+    `atualizado_em`) diz se algum processo alterou o catálogo; só então a
+    recarga completa é feita.
+    """
+
+    def __init__(self, repositorio, intervalo_verificacao=30, relogio=time.monotonic):
+        self._repositorio = repositorio
+        self.intervalo_verificacao = intervalo_verificacao
+        self._relogio = relogio
+        self._lock = threading.Lock()
+        self._indice = None
+        self._assinatura = None
+        self._verificado_em = None
+
+    def recarregar(self):
+        """Lê o catálogo completo do banco e troca o índice em memória."""
+        especialidades, medicos = self._repositorio.carregar_catalogo()
+        assinatura = self._repositorio.assinatura_catalogo()
+        with self._lock:
+            self._indice = _Indice(especialidades, medicos)
+            self._assinatura = assinatura
+            self._verificado_em = self._relogio()
+
+    def invalidar(self):
+        """Força a recarga no próximo acesso (ex.: logo após cadastrar um médico)."""
+        with self._lock:
+            self._indice = None
+
+    def _atual(self):
+        indice = self._indice
+        if indice is None:
+            self.recarregar()
+            return self._indice
+        if self._relogio() - self._verificado_em >= self.intervalo_verificacao:
+            try:
+                assinatura = self._repositorio.assinatura_catalogo()
+                if assinatura != self._assinatura:
+                    self.recarregar()
+                    return self._indice
+                self._verificado_em = self._relogio()
+            except Exception as err:
+                # Sem banco, seguimos com a última versão conhecida do catálogo
+                logger.error(f"Erro ao verificar o catálogo de médicos: {err}")
+        return indice
+
+    def especialidades(self):
+        return [e['nome'] for e in self._atual().especialidades]
+
+    def especialidade_valida(self, texto):
+        """Retorna o nome oficial da especialidade (ignorando acentos e caixa) ou None."""
+        especialidade = self._atual().especialidades_por_nome.get(normalizar(texto))
+        return especialidade['nome'] if especialidade else None
+
+    def medico(self, medico_id):
+        return self._atual().medicos.get(medico_id)
+
+    def resolver_medico(self, texto, especialidade=None):
+        """Lista os médicos cujo nome casa com `texto`.
+
+        Cada palavra digitada precisa ser prefixo de alguma palavra do nome, sem
+        considerar acentos, caixa ou 'Dr.'/'Dra.': 'dra jul' encontra 'Dra. Júlia
+        Souza'. Se houver mais de um candidato e `especialidade` for informada, os
+        médicos dessa especialidade têm preferência.
+        """
+        indice = self._atual()
+        termos = tokens_do_nome(texto)
+        if not termos:
+            return []
+        ids = None
+        for termo in termos:
+            encontrados = indice.ids_com_prefixo(termo)
+            ids = encontrados if ids is None else ids & encontrados
+            if not ids:
+                return []
+        candidatos = sorted((indice.medicos[i] for i in ids), key=lambda m: m['nome'])
+        if len(candidatos) > 1:
+            # Nome idêntico ao digitado vence os que só casam por prefixo
+            exatos = [m for m in candidatos if tokens_do_nome(m['nome']) == termos]
+            if exatos:
+                candidatos = exatos
+        if len(candidatos) > 1 and especialidade:
+            da_especialidade = [m for m in candidatos if m['especialidade'] == especialidade]
+            if da_especialidade:
+                candidatos = da_especialidade
+        return candidatos
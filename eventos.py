@@ -0,0 +1,207 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# --- Eventos ---
+# Cada escrita em `agendamentos` (API, painel ou bot) grava uma linha em
+# `agendamentos_eventos` na mesma transação (ver repositorio.py). O id
+# auto-incremento é o id do evento usado no SSE, então a retomada pelo
+# `Last-Event-ID` funciona entre processos e após reinícios.
+#
+# Garantia de entrega: os eventos saem em ordem de id e sem buracos. Com vários
+# processos escrevendo, o MySQL pode tornar visível o id 11 antes do 10 (o 10
+# ainda está em uma transação aberta); o leitor segura o 11 até o 10 aparecer.
+# Se o id que falta não aparecer em `espera_lacuna` segundos (transação desfeita,
+# que consome o id sem gravar nada), o leitor segue sem ele e registra um aviso.
+# Uma transação que demore mais do que isso para fazer commit perde o evento
+# no stream ao vivo (a lista em /agendamentos continua correta). Isso supõe
+# `auto_increment_increment = 1`, o padrão do MySQL.
+
+
+def formatar_sse(evento):
+    """Converte um evento no formato de texto do Server-Sent Events."""
+    corpo = json.dumps({
+        'tipo': evento['tipo'],
+        'agendamento_id': evento.get('agendamento_id'),
+        'dados': evento.get('dados'),
+    }, default=str)
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {corpo}\n\n"
+
+
+# --- Feed em Memória ---
+class Assinante:
+    """Cliente conectado ao feed, com fila limitada de eventos pendentes.
+
+    `piso` é o Last-Event-ID informado pelo cliente: eventos com id até ele
+    já foram recebidos e nunca são reenviados.
+    """
+
+    def __init__(self, tamanho_fila, piso=None):
+        self.fila = queue.Queue(maxsize=tamanho_fila)
+        self.transbordou = False
+        self.piso = piso
+
+    def entregar(self, evento):
+        if self.transbordou:
+            return
+        if self.piso is not None and evento['tipo'] != 'reset' and evento['id'] <= self.piso:
+            return
+        try:
+            self.fila.put_nowait(evento)
+        except queue.Full:
+            # Cliente lento: paramos de enfileirar de vez (para não criar buracos). O
+            # stream é encerrado quando a fila esvaziar e o navegador reconecta
+            # com o Last-Event-ID do último evento recebido.
+            self.transbordou = True
+
+    def encerrado(self):
+        return self.transbordou and self.fila.empty()
+
+    def proximo(self, timeout):
+        """Retorna o próximo evento ou None se nada chegou dentro do timeout."""
+        try:
+            return self.fila.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class FeedDeAgendamentos:
+    """Buffer circular dos últimos eventos e distribuição para os assinantes."""
+
+    def __init__(self, tamanho_buffer=1000, tamanho_fila_cliente=200):
+        self._eventos = deque(maxlen=tamanho_buffer)
+        self._assinantes = set()
+        self._aguardando = []
+        self._lock = threading.Lock()
+        self._novidade = threading.Event()
+        self.tamanho_fila_cliente = tamanho_fila_cliente
+        self.ultimo_id = 0
+        self.carregado = False
+
+    def carregar(self, eventos):
+        """Preenche o buffer com a primeira leitura da tabela, sem entregar nada ao vivo.
+
+        Até aqui o feed não sabe onde a tabela está, então quem reconectou com
+        Last-Event-ID ficou aguardando: agora recebe o que perdeu (ou um reset).
+        """
+        with self._lock:
+            for evento in eventos:
+                if evento['id'] > self.ultimo_id:
+                    self._eventos.append(evento)
+                    self.ultimo_id = evento['id']
+            self.carregado = True
+            for assinante in self._aguardando:
+                self._reenviar(assinante)
+            self._aguardando = []
+
+    def publicar(self, evento):
+        with self._lock:
+            if evento['id'] <= self.ultimo_id:
+                return
+            self._eventos.append(evento)
+            self.ultimo_id = evento['id']
+            for assinante in self._assinantes:
+                assinante.entregar(evento)
+
+    def assinar(self, ultimo_id_cliente=None):
+        """Registra um assinante e reenvia o que ele perdeu desde `ultimo_id_cliente`."""
+        assinante = Assinante(self.tamanho_fila_cliente, piso=ultimo_id_cliente)
+        with self._lock:
+            if ultimo_id_cliente is not None:
+                if self.carregado:
+                    self._reenviar(assinante)
+                else:
+                    # Logo após o reinício o buffer ainda está vazio: o reenvio espera a primeira leitura
+                    self._aguardando.append(assinante)
+            self._assinantes.add(assinante)
+        return assinante
+
+    def _reenviar(self, assinante):
+        # Chamado com o lock adquirido
+        if assinante.piso >= self.ultimo_id:
+            return
+        mais_antigo = self._eventos[0]['id'] if self._eventos else self.ultimo_id + 1
+        if assinante.piso < mais_antigo - 1:
+            # O buffer já descartou parte do que o cliente perdeu: ele precisa
+            # recarregar a lista completa em /agendamentos.
+            assinante.entregar({'id': self.ultimo_id, 'tipo': 'reset'})
+        else:
+            for evento in self._eventos:
+                assinante.entregar(evento)
+
+    def cancelar(self, assinante):
+        with self._lock:
+            self._assinantes.discard(assinante)
+            if assinante in self._aguardando:
+                self._aguardando.remove(assinante)
+
+    def notificar(self):
+        """Acorda o leitor da tabela logo após um commit feito neste processo."""
+        self._novidade.set()
+
+    def aguardar_notificacao(self, timeout):
+        self._novidade.wait(timeout)
+        self._novidade.clear()
+
+
+class LeitorDeEventos:
+    """Leva os eventos da tabela para o feed, em ordem de id e sem pular ids."""
+
+    def __init__(self, feed, repositorio, limite=500, espera_lacuna=5, relogio=time.monotonic):
+        self.feed = feed
+        self.repositorio = repositorio
+        self.limite = limite
+        self.espera_lacuna = espera_lacuna
+        self.relogio = relogio
+        self._lacuna = None  # (id que falta, desde quando)
+
+    def passo(self):
+        """Faz uma leitura; retorna True se ainda há eventos para ler imediatamente."""
+        # Sempre a partir do último id publicado: os ids acima de uma lacuna são
+        # relidos a cada passo até ela ser preenchida.
+        eventos = self.repositorio.ler_eventos(self.feed.ultimo_id, self.limite)
+        if not self.feed.carregado:
+            # Primeira leitura (ultimo_id 0 traz os `limite` mais recentes): é
+            # passado, não novidade, então só alimenta o buffer de reenvio.
+            self.feed.carregar(eventos)
+            return False
+        for evento in eventos:
+            esperado = self.feed.ultimo_id + 1
+            if self.feed.ultimo_id and evento['id'] != esperado:
+                if not self._lacuna_expirou(esperado):
+                    return False
+                logger.warning(f"Eventos {esperado} a {evento['id'] - 1} não apareceram em "
+                               f"{self.espera_lacuna}s; seguindo sem eles.")
+            self.feed.publicar(evento)
+            self._lacuna = None
+        return len(eventos) == self.limite
+
+    def _lacuna_expirou(self, id_esperado):
+        agora = self.relogio()
+        if self._lacuna is None or self._lacuna[0] != id_esperado:
+            self._lacuna = (id_esperado, agora)
+        return agora - self._lacuna[1] >= self.espera_lacuna
+
+
+def acompanhar_tabela(feed, repositorio, intervalo=0.5, limite=500):
+    """Lê continuamente a tabela de eventos e publica as novidades no feed."""
+    leitor = LeitorDeEventos(feed, repositorio, limite)
+    while True:
+        try:
+            if leitor.passo():
+                continue
+        except Exception as err:
+            logger.error(f"Erro ao ler a tabela de eventos: {err}")
+        feed.aguardar_notificacao(intervalo)
+
+
+def iniciar_acompanhamento(feed, repositorio, intervalo=0.5):
+    """Inicia o leitor da tabela de eventos em uma thread de fundo."""
+    thread = threading.Thread(target=acompanhar_tabela, args=(feed, repositorio, intervalo), daemon=True)
+    thread.start()
+    return thread
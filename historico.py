@@ -0,0 +1,30 @@
+import logging
+import os
+from datetime import datetime
+
+from repositorio import obter_repositorio
+
+logger = logging.getLogger(__name__)
+
+# --- Tabela de Histórico ---
+# `agendamentos` guarda só as consultas de hoje em diante (tabela "quente"). As
+# consultas passadas são movidas diariamente para `agendamentos_historico`, que
+# só é lida pelas rotas de histórico. As queries ficam em repositorio.py
+# (`arquivar_passados` e `buscar_historico`). A mesma rotina apaga os eventos
+# antigos do feed de agendamentos (`podar_eventos`).
+
+
+if __name__ == '__main__':
+    # Execução manual ou via cron: python historico.py
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    repositorio = obter_repositorio({
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'user': os.getenv('DB_USER', 'root'),
+        'password': os.getenv('DB_PASSWORD'),
+        'database': os.getenv('DB_DATABASE', 'clinica_bot')
+    })
+    repositorio.criar_tabelas()
+    movidas = repositorio.arquivar_passados()
+    logger.info(f"{movidas} consultas anteriores a {datetime.now().strftime('%d/%m/%Y')} movidas para o histórico.")
+    podados = repositorio.podar_eventos()
+    logger.info(f"{podados} eventos antigos do feed de agendamentos apagados.")
@@ -0,0 +1,163 @@
+import asyncio
+import time
+from functools import wraps
+
+
+class TokenBucket:
+    """Balde de fichas: `taxa` fichas por segundo, acumulando até `capacidade`."""
+
+    def __init__(self, taxa, capacidade, relogio=time.monotonic):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.fichas = float(capacidade)
+        self._relogio = relogio
+        self._atualizado = relogio()
+
+    def _repor(self):
+        agora = self._relogio()
+        self.fichas = min(self.capacidade, self.fichas + (agora - self._atualizado) * self.taxa)
+        self._atualizado = agora
+
+    def reservar(self, atraso_maximo=0.0):
+        """Reserva uma ficha e retorna quanto esperar por ela, ou None se passar do atraso máximo."""
+        self._repor()
+        espera = 0.0 if self.fichas >= 1 else (1 - self.fichas) / self.taxa
+        if espera > atraso_maximo:
+            return None
+        # A ficha pode ficar "devendo": quem chegar depois espera a reposição
+        self.fichas -= 1
+        return espera
+
+    def devolver(self):
+        self.fichas = min(self.capacidade, self.fichas + 1)
+
+    def cheio(self):
+        self._repor()
+        return self.fichas >= self.capacidade
+
+
+class _EstadoUsuario:
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.lock = asyncio.Lock()
+        self.ultimo_aviso = None
+
+
+class ControleDeFluxo:
+    """Limita mensagens por usuário e no total, com fila limitada e descarte de carga.
+
+    Cada atualização passa por três filtros:
+      1. balde do usuário (protege contra um único chat inundando o bot);
+      2. balde global (protege o MySQL em rajadas, ex.: após um broadcast);
+      3. fila de trabalho limitada a `max_fila` atualizações aguardando uma das
+         `max_concorrentes` vagas de execução.
+    Se a espera num balde passar de `atraso_maximo` ou a fila estiver cheia, a
+    atualização é descartada e o usuário recebe um aviso (no máximo um por
+    `intervalo_aviso` segundos, para não amplificar o flood).
+    """
+
+    def __init__(self, taxa_usuario=1.0, rajada_usuario=5, taxa_global=30.0, rajada_global=60,
+                 atraso_maximo=2.0, max_concorrentes=20, max_fila=200, intervalo_aviso=10.0,
+                 max_usuarios=10000, relogio=time.monotonic, dormir=asyncio.sleep):
+        self.taxa_usuario = taxa_usuario
+        self.rajada_usuario = rajada_usuario
+        self.atraso_maximo = atraso_maximo
+        self.max_fila = max_fila
+        self.intervalo_aviso = intervalo_aviso
+        self.max_usuarios = max_usuarios
+        self._relogio = relogio
+        self._dormir = dormir
+        self._global = TokenBucket(taxa_global, rajada_global, relogio)
+        self._vagas = asyncio.Semaphore(max_concorrentes)
+        self._usuarios = {}
+        self.pendentes = 0
+        self.processadas = 0
+        self.atrasadas = 0
+        self.descartadas_usuario = 0
+        self.descartadas_global = 0
+        self.descartadas_fila = 0
+
+    def _estado(self, user_id):
+        estado = self._usuarios.get(user_id)
+        if estado is None:
+            if len(self._usuarios) >= self.max_usuarios:
+                self._limpar_ociosos()
+            estado = _EstadoUsuario(TokenBucket(self.taxa_usuario, self.rajada_usuario, self._relogio))
+            self._usuarios[user_id] = estado
+        return estado
+
+    def _limpar_ociosos(self):
+        """Remove usuários sem mensagens em andamento e com o balde já cheio."""
+        for user_id in [u for u, e in self._usuarios.items() if not e.lock.locked() and e.bucket.cheio()]:
+            del self._usuarios[user_id]
+
+    def _reservar(self, estado):
+        """Retorna (espera, motivo); motivo é preenchido quando a mensagem deve ser descartada."""
+        espera_usuario = estado.bucket.reservar(self.atraso_maximo)
+        if espera_usuario is None:
+            return None, 'usuario'
+        espera_global = self._global.reservar(self.atraso_maximo)
+        if espera_global is None:
+            estado.bucket.devolver()
+            return None, 'global'
+        return max(espera_usuario, espera_global), None
+
+    def _deve_avisar(self, estado):
+        agora = self._relogio()
+        if estado.ultimo_aviso is not None and agora - estado.ultimo_aviso < self.intervalo_aviso:
+            return False
+        estado.ultimo_aviso = agora
+        return True
+
+    async def executar(self, user_id, funcao, *args, ao_descartar=None):
+        """Executa `funcao(*args)` respeitando os limites. Retorna False se a mensagem foi descartada."""
+        estado = self._estado(user_id)
+
+        if self.pendentes >= self.max_fila:
+            self.descartadas_fila += 1
+            motivo = 'fila'
+        else:
+            espera, motivo = self._reservar(estado)
+            if motivo == 'usuario':
+                self.descartadas_usuario += 1
+            elif motivo == 'global':
+                self.descartadas_global += 1
+
+        if motivo:
+            if ao_descartar and self._deve_avisar(estado):
+                await ao_descartar()
+            return False
+
+        self.pendentes += 1
+        try:
+            if espera > 0:
+                self.atrasadas += 1
+                await self._dormir(espera)
+            # O lock por usuário mantém a ordem das mensagens de um mesmo chat
+            async with estado.lock:
+                async with self._vagas:
+                    await funcao(*args)
+            self.processadas += 1
+            return True
+        finally:
+            self.pendentes -= 1
+
+    def estatisticas(self):
+        return {
+            'processadas': self.processadas,
+            'atrasadas': self.atrasadas,
+            'descartadas_usuario': self.descartadas_usuario,
+            'descartadas_global': self.descartadas_global,
+            'descartadas_fila': self.descartadas_fila,
+            'pendentes': self.pendentes,
+            'usuarios_monitorados': len(self._usuarios),
+        }
+
+    def proteger(self, handler, mensagem_descarte):
+        """Envolve um handler do python-telegram-bot com o controle de fluxo."""
+        @wraps(handler)
+        async def handler_protegido(update, context):
+            async def avisar():
+                await update.message.reply_text(mensagem_descarte)
+            await self.executar(update.effective_user.id, handler, update, context, ao_descartar=avisar)
+        return handler_protegido
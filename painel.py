@@ -1,10 +1,11 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-import mysql.connector
 from datetime import datetime, timedelta
 from models import get_user, get_user_by_username
-import locale
-locale.setlocale(locale.LC_TIME, 'pt_BR.UTF-8')
+from catalogo import Catalogo
+from repositorio import obter_repositorio, dia_da_semana, ErroDeBanco
+from perfilador import Perfilador, como_booleano
+import time
 
 # Inicialização do Flask
 app = Flask(__name__)
@@ -27,122 +28,89 @@ DB_CONFIG = {
     'database': 'clinica_bot'
 }
 
-def is_horario_disponivel(medico, data, horario, agendamento_id=None):
-    conn = None
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        
-        # 1. Validação do horário de trabalho do médico
-        dia_da_semana = datetime.strptime(data, '%d/%m/%Y').strftime('%A')
-        query_disponibilidade = """
-            SELECT * FROM medico_disponibilidade
-            WHERE medico_nome = %s AND dia_da_semana = %s AND horario_inicio <= %s AND horario_fim >= %s
-        """
-        cursor.execute(query_disponibilidade, (medico, dia_da_semana, horario, horario))
-        if not cursor.fetchone():
-            return False, f"Dr(a). {medico} não atende na {dia_da_semana} neste horário."
-
-        # 2. Validação de agendamento duplicado
-        query_check = "SELECT id FROM agendamentos WHERE data = %s AND horario = %s AND medico = %s"
-        
-        # Exclui o agendamento atual da validação de duplicidade
-        if agendamento_id:
-            query_check += " AND id != %s"
-            cursor.execute(query_check, (data, horario, medico, agendamento_id))
-        else:
-            cursor.execute(query_check, (data, horario, medico))
+# Backend em CLINICA_BACKEND; no MySQL as leituras vão para as réplicas (DB_REPLICAS)
+# e as escritas e validações, para o primário
+repositorio = obter_repositorio(DB_CONFIG)
+
+# Após uma escrita, as leituras do mesmo usuário vão ao primário por alguns segundos
+# para que a mudança apareça mesmo com atraso de replicação
+JANELA_LEITURA_PRIMARIO = 10
+
+def registrar_escrita():
+    session['escreveu_em'] = time.time()
+
+def escreveu_recentemente():
+    return time.time() - session.get('escreveu_em', 0) < JANELA_LEITURA_PRIMARIO
 
-        if cursor.fetchone():
-            return False, f"O horário das {horario} com Dr(a). {medico} já está ocupado."
+catalogo = Catalogo(repositorio)
 
-        return True, None
+# Profiling por amostragem (PERFIL_ATIVO=1 ou rota /admin/perfil)
+perfilador = Perfilador.do_ambiente()
 
-    except mysql.connector.Error as err:
+def resolver_medico(texto, especialidade=None):
+    """Retorna (medico, mensagem_de_erro) usando o catálogo de médicos."""
+    candidatos = catalogo.resolver_medico(texto, especialidade)
+    if not candidatos:
+        return None, f"Médico '{texto}' não encontrado no cadastro."
+    if len(candidatos) > 1:
+        nomes = ', '.join(m['nome'] for m in candidatos[:5])
+        return None, f"Mais de um médico corresponde a '{texto}': {nomes}."
+    return candidatos[0], None
+
+def is_horario_disponivel(medico_id, data, horario, agendamento_id=None):
+    try:
+        motivo = repositorio.verificar_disponibilidade(medico_id, data, horario, ignorar_id=agendamento_id)
+    except ErroDeBanco as err:
         print(f"Erro ao verificar a disponibilidade: {err}")
         return False, "Ocorreu um erro no banco de dados. Tente novamente."
-    finally:
-        if conn and conn.is_connected():
-            cursor.close()
-            conn.close()
 
-def get_agendamentos(termo_busca=None):
+    medico = catalogo.medico(medico_id)['nome']
+    # 1. Validação do horário de trabalho do médico
+    if motivo == 'indisponivel':
+        return False, f"Dr(a). {medico} não atende na {dia_da_semana(data)} neste horário."
+    # 2. Validação de agendamento duplicado
+    if motivo == 'ocupado':
+        return False, f"O horário das {horario} com Dr(a). {medico} já está ocupado."
+    return True, None
+
+def get_agendamentos(termo_busca=None, exigir_primario=False):
     """Busca agendamentos no banco de dados com opção de filtro."""
-    conn = None
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor(dictionary=True)
-        query = "SELECT id, nome, especialidade, data, horario, medico FROM agendamentos"
-        
-        if termo_busca:
-            query += " WHERE nome LIKE %s OR especialidade LIKE %s OR medico LIKE %s"
-            termo_busca = f"%{termo_busca}%"
-            cursor.execute(query, (termo_busca, termo_busca, termo_busca))
-        else:
-            cursor.execute(query)
-            
-        agendamentos = cursor.fetchall()
-        
-        agendamentos.sort(key=lambda x: (
-            datetime.strptime(x['data'], '%d/%m/%Y'),
-            datetime.strptime(x['horario'], '%H:%M')
-        ))
-        
-        return agendamentos
-    except mysql.connector.Error as err:
+        return repositorio.listar_agendamentos(termo_busca, exigir_primario)
+    except ErroDeBanco as err:
         print(f"Erro no banco de dados: {err}")
         return []
-    finally:
-        if conn and conn.is_connected():
-            cursor.close()
-            conn.close()
 
 # Rotas protegidas (agora exigem login)
 @app.route('/')
 @login_required
+@perfilador.perfilar('painel.dashboard')
 def dashboard():
     termo_busca = request.args.get('busca')
-    agendamentos = get_agendamentos(termo_busca)
+    agendamentos = get_agendamentos(termo_busca, exigir_primario=escreveu_recentemente())
     return render_template('dashboard.html', agendamentos=agendamentos, termo_busca=termo_busca)
 
 @app.route('/excluir/<int:id>')
 @login_required
 def excluir_agendamento(id):
-    conn = None
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        query = "DELETE FROM agendamentos WHERE id = %s"
-        cursor.execute(query, (id,))
-        conn.commit()
+        repositorio.excluir_agendamento(id)
+        registrar_escrita()
         flash('Agendamento excluído com sucesso.', 'success')
-    except mysql.connector.Error as err:
+    except ErroDeBanco as err:
         print(f"Erro ao excluir agendamento: {err}")
         flash('Erro ao excluir agendamento. Tente novamente.', 'danger')
-    finally:
-        if conn and conn.is_connected():
-            cursor.close()
-            conn.close()
     
     return redirect(url_for('dashboard'))
 
 @app.route('/editar/<int:id>', methods=['GET'])
 @login_required
 def editar_agendamento(id):
-    conn = None
     agendamento = None
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor(dictionary=True)
-        query = "SELECT id, nome, especialidade, data, horario, medico FROM agendamentos WHERE id = %s"
-        cursor.execute(query, (id,))
-        agendamento = cursor.fetchone()
-    except mysql.connector.Error as err:
+        agendamento = repositorio.buscar_agendamento(id, exigir_primario=escreveu_recentemente())
+    except ErroDeBanco as err:
         print(f"Erro ao buscar agendamento para edição: {err}")
-    finally:
-        if conn and conn.is_connected():
-            cursor.close()
-            conn.close()
     
     if agendamento:
         return render_template('editar.html', agendamento=agendamento)
@@ -152,38 +120,174 @@ def editar_agendamento(id):
 
 @app.route('/atualizar/<int:id>', methods=['POST'])
 @login_required
+@perfilador.perfilar('painel.atualizar_agendamento')
 def atualizar_agendamento(id):
     novo_nome = request.form['nome']
     nova_especialidade = request.form['especialidade']
-    novo_medico = request.form['medico']
     nova_data = request.form['data']
     novo_horario = request.form['horario']
     
+    medico, error_msg = resolver_medico(request.form['medico'], nova_especialidade)
+    if not medico:
+        flash(error_msg, 'danger')
+        return redirect(url_for('editar_agendamento', id=id))
+    novo_medico = medico['nome']
+    
     # Validação em tempo real
-    is_valid, error_msg = is_horario_disponivel(novo_medico, nova_data, novo_horario, agendamento_id=id)
+    is_valid, error_msg = is_horario_disponivel(medico['id'], nova_data, novo_horario, agendamento_id=id)
     if not is_valid:
         flash(error_msg, 'danger')
         return redirect(url_for('editar_agendamento', id=id))
 
-    conn = None
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        query = "UPDATE agendamentos SET nome = %s, especialidade = %s, medico = %s, data = %s, horario = %s WHERE id = %s"
-        values = (novo_nome, nova_especialidade, novo_medico, nova_data, novo_horario, id)
-        cursor.execute(query, values)
-        conn.commit()
+        repositorio.atualizar_agendamento(id, {
+            'nome': novo_nome, 'especialidade': nova_especialidade,
+            'medico': novo_medico, 'medico_id': medico['id'], 'data': nova_data, 'horario': novo_horario
+        })
+        registrar_escrita()
         flash('Agendamento atualizado com sucesso!', 'success')
-    except mysql.connector.Error as err:
+    except ErroDeBanco as err:
         print(f"Erro ao atualizar agendamento: {err}")
         flash('Erro ao atualizar agendamento. Tente novamente.', 'danger')
-    finally:
-        if conn and conn.is_connected():
-            cursor.close()
-            conn.close()
     
     return redirect(url_for('dashboard'))
 
+# Ações em lote (vários agendamentos em uma única transação)
+def ids_da_requisicao(dados):
+    """Lê a lista de ids do JSON (`ids`) ou do formulário de seleção múltipla (`ids` repetido).
+
+    Levanta ValueError se o JSON não trouxer uma lista de inteiros.
+    """
+    if not request.is_json:
+        return list(dict.fromkeys(int(i) for i in request.form.getlist('ids')))
+    ids = dados.get('ids', [])
+    # Uma string como "12" também é iterável e viraria os ids 1 e 2
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        raise ValueError('ids deve ser uma lista de inteiros')
+    return list(dict.fromkeys(ids))
+
+def responder_lote(resultados, sucesso, mensagem):
+    """Retorna o resultado por linha em JSON ou, vindo do formulário, um resumo no flash."""
+    if request.is_json:
+        return jsonify({'resultados': resultados})
+    total_ok = sum(1 for r in resultados if r['status'] == sucesso)
+    flash(mensagem.format(total_ok, len(resultados)), 'success' if total_ok == len(resultados) else 'warning')
+    for r in resultados:
+        if r['status'] != sucesso:
+            flash(f"Agendamento {r['id']}: {r['mensagem']}", 'danger')
+    return redirect(url_for('dashboard'))
+
+@app.route('/excluir_em_lote', methods=['POST'])
+@login_required
+@perfilador.perfilar('painel.excluir_em_lote')
+def excluir_em_lote():
+    dados = request.get_json(silent=True) or {}
+    if not isinstance(dados, dict):
+        return jsonify({'error': 'Envie um objeto JSON com os ids.'}), 400
+    try:
+        ids = ids_da_requisicao(dados)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Lista de ids inválida.'}), 400
+    if not ids:
+        return jsonify({'error': 'Nenhum agendamento selecionado.'}), 400
+
+    try:
+        existentes = repositorio.excluir_em_lote(ids)
+        registrar_escrita()
+    except ErroDeBanco as err:
+        print(f"Erro ao excluir agendamentos em lote: {err}")
+        return jsonify({'error': 'Erro no banco de dados. Nenhum agendamento foi excluído.'}), 500
+
+    resultados = [
+        {'id': i, 'status': 'excluido', 'mensagem': 'Agendamento excluído.'} if i in existentes
+        else {'id': i, 'status': 'nao_encontrado', 'mensagem': 'Agendamento não encontrado.'}
+        for i in ids
+    ]
+    return responder_lote(resultados, 'excluido', '{} de {} agendamentos excluídos.')
+
+@app.route('/reagendar_em_lote', methods=['POST'])
+@login_required
+@perfilador.perfilar('painel.reagendar_em_lote')
+def reagendar_em_lote():
+    """Move os agendamentos selecionados para `data`, opcionalmente com outro médico ou horário.
+
+    Aceita JSON {"ids": [...], "data": "dd/mm/aaaa", "medico": "...", "horarios": {"id": "hh:mm"}}
+    ou o formulário equivalente (sem `horarios`). Cada agendamento mantém o seu
+    horário, a menos que outro seja informado em `horarios`.
+    """
+    dados = request.get_json(silent=True) or {}
+    if not isinstance(dados, dict):
+        return jsonify({'error': 'Envie um objeto JSON com ids e data.'}), 400
+    fonte = dados if request.is_json else request.form
+    nova_data = fonte.get('data')
+    texto_medico = fonte.get('medico')
+    horarios = dados.get('horarios', {}) if request.is_json else {}
+    try:
+        ids = ids_da_requisicao(dados)
+        if not isinstance(horarios, dict):
+            raise ValueError('horarios deve ser um objeto {id: "hh:mm"}')
+        if texto_medico is not None and not isinstance(texto_medico, str):
+            raise ValueError('medico deve ser um texto')
+        data_destino = datetime.strptime(nova_data or '', '%d/%m/%Y').date()
+        for horario in horarios.values():
+            datetime.strptime(horario, '%H:%M')
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Informe os ids, a data (dd/mm/aaaa) e horários no formato hh:mm.'}), 400
+    if not ids:
+        return jsonify({'error': 'Nenhum agendamento selecionado.'}), 400
+    # Uma consulta movida para o passado iria direto para o histórico no próximo arquivamento
+    if data_destino < datetime.now().date():
+        return jsonify({'error': 'A nova data não pode estar no passado.'}), 400
+
+    novo_medico = None
+    if texto_medico:
+        novo_medico, error_msg = resolver_medico(texto_medico)
+        if not novo_medico:
+            return jsonify({'error': error_msg}), 400
+
+    try:
+        resultados = repositorio.reagendar_em_lote(ids, nova_data, novo_medico['id'] if novo_medico else None, horarios)
+        registrar_escrita()
+    except ErroDeBanco as err:
+        print(f"Erro ao reagendar agendamentos em lote: {err}")
+        return jsonify({'error': 'Erro no banco de dados. Nenhum agendamento foi alterado.'}), 500
+
+    for resultado in resultados:
+        if resultado['status'] == 'nao_encontrado':
+            resultado['mensagem'] = 'Agendamento não encontrado.'
+            continue
+        medico = catalogo.medico(resultado['medico_id']) or {'nome': f"#{resultado['medico_id']}"}
+        if resultado['status'] == 'indisponivel':
+            resultado['mensagem'] = f"Dr(a). {medico['nome']} não atende em {nova_data} às {resultado['horario']}."
+        elif resultado['status'] == 'ocupado':
+            resultado['mensagem'] = f"O horário das {resultado['horario']} com Dr(a). {medico['nome']} já está ocupado."
+        else:
+            resultado['mensagem'] = f"Reagendado para {nova_data} às {resultado['horario']}."
+
+    return responder_lote(resultados, 'reagendado', '{} de {} agendamentos reagendados.')
+
+# Administração do profiling
+@app.route('/admin/perfil', methods=['GET', 'POST'])
+@login_required
+def admin_perfil():
+    """GET: estado e top-N funções mais custosas. POST: liga/desliga, muda a amostra ou zera o agregado."""
+    if request.method == 'POST':
+        dados = request.get_json(silent=True) or request.form
+        if not isinstance(dados, dict):
+            return jsonify({'error': 'Envie um objeto JSON com ativo, amostra e/ou resetar.'}), 400
+        try:
+            amostra = dados.get('amostra')
+            perfilador.configurar(ativo=dados.get('ativo'), amostra=float(amostra) if amostra is not None else None)
+        except (TypeError, ValueError) as err:
+            return jsonify({'error': str(err)}), 400
+        if como_booleano(dados.get('resetar')):
+            perfilador.resetar()
+    try:
+        n = int(request.args.get('n', 20))
+        return jsonify({'estado': perfilador.estado(), **perfilador.top(n, request.args.get('ordem', 'tottime'))})
+    except (KeyError, ValueError):
+        return jsonify({'error': "Use n inteiro e ordem 'tottime', 'cumtime' ou 'ncalls'."}), 400
+
 # Rotas de Login e Logout
 @app.route('/login', methods=['GET', 'POST'])
 def login():
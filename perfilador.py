@@ -0,0 +1,179 @@
+import cProfile
+import glob
+import inspect
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+
+def como_booleano(valor):
+    """Interpreta um liga/desliga vindo de JSON, formulário ou variável de ambiente: "false" e "0" desligam."""
+    if isinstance(valor, str):
+        return valor.strip().lower() in ('1', 'true', 'sim')
+    return bool(valor)
+
+
+class Perfilador:
+    """Perfis cProfile de uma amostra das chamadas de rotas e handlers.
+
+    Desligado, o custo por chamada é só a checagem de `self.ativo`. Ligado
+    (PERFIL_ATIVO=1 ou pela rota de administração), uma fração `amostra` das
+    chamadas é perfilada: cada perfil vai para um arquivo .prof em `diretorio`
+    e é somado ao agregado que alimenta o top-N de funções mais custosas. O
+    diretório guarda só os `max_arquivos` perfis mais recentes; como API, painel
+    e bot podem usar o mesmo PERFIL_DIR, a contagem é feita no próprio diretório.
+
+    Em handlers assíncronos o perfil cobre tudo o que a thread executou
+    durante a chamada, inclusive outras corrotinas que rodaram nos `await`.
+    """
+
+    def __init__(self, ativo=False, amostra=0.1, diretorio='perfis', max_arquivos=200):
+        self.ativo = ativo
+        self.amostra = amostra
+        self.diretorio = diretorio
+        self._lock = threading.Lock()
+        self.max_arquivos = max_arquivos
+        self._agregado = {}
+        self._chamadas = {}
+        self._sequencia = 0
+        self._local = threading.local()
+
+    @classmethod
+    def do_ambiente(cls):
+        return cls(
+            ativo=como_booleano(os.getenv('PERFIL_ATIVO', '')),
+            amostra=float(os.getenv('PERFIL_AMOSTRA', '0.1')),
+            diretorio=os.getenv('PERFIL_DIR', 'perfis'),
+            max_arquivos=int(os.getenv('PERFIL_MAX_ARQUIVOS', '200'))
+        )
+
+    def configurar(self, ativo=None, amostra=None):
+        if amostra is not None:
+            if not 0 <= amostra <= 1:
+                raise ValueError("A amostra deve estar entre 0 e 1.")
+            self.amostra = amostra
+        if ativo is not None:
+            self.ativo = como_booleano(ativo)
+
+    def _sortear(self):
+        return self.ativo and random.random() < self.amostra
+
+    def _iniciar(self):
+        # Só um perfil por thread: chamadas aninhadas ou corrotinas concorrentes ficam sem amostra
+        if getattr(self._local, 'perfilando', False):
+            return None
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:
+            # Outra ferramenta de profiling já está ativa no interpretador
+            return None
+        self._local.perfilando = True
+        return perfil
+
+    def perfilar(self, nome):
+        """Decorador para funções síncronas (rotas Flask) ou assíncronas (handlers do bot)."""
+        def decorador(funcao):
+            if inspect.iscoroutinefunction(funcao):
+                @wraps(funcao)
+                async def envolvida_async(*args, **kwargs):
+                    if not self._sortear():
+                        return await funcao(*args, **kwargs)
+                    perfil = self._iniciar()
+                    inicio = time.perf_counter()
+                    try:
+                        return await funcao(*args, **kwargs)
+                    finally:
+                        self._finalizar(nome, perfil, time.perf_counter() - inicio)
+                return envolvida_async
+
+            @wraps(funcao)
+            def envolvida(*args, **kwargs):
+                if not self._sortear():
+                    return funcao(*args, **kwargs)
+                perfil = self._iniciar()
+                inicio = time.perf_counter()
+                try:
+                    return funcao(*args, **kwargs)
+                finally:
+                    self._finalizar(nome, perfil, time.perf_counter() - inicio)
+            return envolvida
+        return decorador
+
+    def _finalizar(self, nome, perfil, duracao):
+        if perfil is None:
+            return
+        perfil.disable()
+        self._local.perfilando = False
+        try:
+            estatisticas = pstats.Stats(perfil)
+            with self._lock:
+                self._sequencia += 1
+                caminho = os.path.join(
+                    self.diretorio,
+                    f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{self._sequencia}_{nome}_{duracao * 1000:.0f}ms.prof"
+                )
+                os.makedirs(self.diretorio, exist_ok=True)
+                estatisticas.dump_stats(caminho)
+                self._rotacionar()
+
+                total, soma = self._chamadas.get(nome, (0, 0.0))
+                self._chamadas[nome] = (total + 1, soma + duracao)
+                for (arquivo, linha, funcao), (_, ncalls, tottime, cumtime, _) in estatisticas.stats.items():
+                    chave = f"{os.path.basename(arquivo)}:{linha}({funcao})"
+                    acumulado = self._agregado.get(chave, (0, 0.0, 0.0))
+                    self._agregado[chave] = (acumulado[0] + ncalls, acumulado[1] + tottime, acumulado[2] + cumtime)
+        except Exception as err:
+            # O perfilador nunca deve derrubar a requisição perfilada
+            logger.error(f"Erro ao gravar o perfil de {nome}: {err}")
+
+    def _arquivos(self):
+        """Perfis do diretório, do mais antigo para o mais recente (de qualquer processo)."""
+        arquivos = []
+        for caminho in glob.glob(os.path.join(self.diretorio, '*.prof')):
+            try:
+                arquivos.append((os.path.getmtime(caminho), caminho))
+            except OSError:
+                # Removido por outro processo entre o glob e o stat
+                continue
+        return [caminho for _, caminho in sorted(arquivos)]
+
+    def _rotacionar(self):
+        arquivos = self._arquivos()
+        for antigo in arquivos[:max(0, len(arquivos) - self.max_arquivos)]:
+            try:
+                os.remove(antigo)
+            except OSError:
+                pass
+
+    def top(self, n=20, ordem='tottime'):
+        """As `n` funções com mais tempo somado nas chamadas perfiladas ('tottime' ou 'cumtime')."""
+        indice = {'ncalls': 0, 'tottime': 1, 'cumtime': 2}[ordem]
+        with self._lock:
+            itens = sorted(self._agregado.items(), key=lambda item: -item[1][indice])[:n]
+            chamadas = dict(self._chamadas)
+        return {
+            'chamadas_perfiladas': {
+                nome: {'quantidade': total, 'media_ms': round(soma / total * 1000, 2)}
+                for nome, (total, soma) in chamadas.items()
+            },
+            'funcoes': [
+                {'funcao': chave, 'ncalls': ncalls, 'tottime_s': round(tottime, 6), 'cumtime_s': round(cumtime, 6)}
+                for chave, (ncalls, tottime, cumtime) in itens
+            ]
+        }
+
+    def resetar(self):
+        with self._lock:
+            self._agregado.clear()
+            self._chamadas.clear()
+
+    def estado(self):
+        return {'ativo': self.ativo, 'amostra': self.amostra, 'diretorio': self.diretorio,
+                'max_arquivos': self.max_arquivos, 'arquivos': len(self._arquivos())}
@@ -0,0 +1,282 @@
+"""Replay de conversas do bot para medir a latência dos handlers.
+
+Alimenta os handlers registrados por `start_and_register_commands` com
+atualizações gravadas (--arquivo, uma mensagem JSON por linha com `user_id` e
+`text`) ou sintéticas (--usuarios), sem falar com o Telegram: o Bot usa uma
+camada de rede falsa que responde localmente. O replay grava agendamentos de
+verdade, então o banco precisa ser indicado explicitamente: DB_DATABASE (uma
+cópia, nunca o banco de produção) ou, com CLINICA_BACKEND=sqlite, SQLITE_PATH.
+Ao final, os agendamentos criados durante o replay são apagados (exceto com --manter).
+
+Exemplos:
+    DB_DATABASE=clinica_bot_replay python replay_bot.py --usuarios 2000 --concorrencia 500
+    CLINICA_BACKEND=sqlite SQLITE_PATH=replay.db python replay_bot.py --arquivo conversas.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+# Sem limites de flood por padrão: o objetivo é medir os handlers, não o controle de fluxo
+for variavel, valor in {'FLUXO_TAXA_USUARIO': '1000', 'FLUXO_RAJADA_USUARIO': '1000',
+                        'FLUXO_TAXA_GLOBAL': '100000', 'FLUXO_RAJADA_GLOBAL': '100000',
+                        'FLUXO_MAX_CONCORRENTES': '1000', 'FLUXO_MAX_FILA': '100000'}.items():
+    os.environ.setdefault(variavel, valor)
+
+# Verificado antes de importar o bot, que conecta ao banco (e carrega o .env) na importação
+if os.getenv('CLINICA_BACKEND', 'mysql').lower() == 'sqlite':
+    if not os.getenv('SQLITE_PATH'):
+        raise SystemExit("Defina SQLITE_PATH com um arquivo só para o replay.")
+elif not os.getenv('DB_DATABASE'):
+    raise SystemExit("Defina DB_DATABASE com um banco só para o replay (ex.: clinica_bot_replay).")
+
+from telegram import Bot, Update
+from telegram.ext import ApplicationBuilder
+from telegram.request import BaseRequest
+
+import bot_clinica
+from repositorio import DIAS_DA_SEMANA, ErroDeBanco
+
+# Ids altos para não colidir com usuários reais do Telegram
+PRIMEIRO_USER_ID_SINTETICO = 9_000_000_000
+
+
+# --- Bot Falso ---
+class RequisicaoFalsa(BaseRequest):
+    """Camada de rede do Bot que responde às chamadas da API do Telegram localmente."""
+
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self.mensagens_enviadas = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+        endpoint = url.rsplit('/', 1)[-1]
+        parametros = request_data.parameters if request_data else {}
+        if endpoint == 'getMe':
+            resultado = {'id': 1, 'is_bot': True, 'first_name': 'Clínica', 'username': 'clinica_replay_bot'}
+        elif endpoint == 'sendMessage':
+            self.mensagens_enviadas += 1
+            resultado = {
+                'message_id': self.mensagens_enviadas,
+                'date': int(time.time()),
+                'chat': {'id': parametros.get('chat_id'), 'type': 'private'},
+                'text': parametros.get('text', '')
+            }
+        else:
+            resultado = True
+        return 200, json.dumps({'ok': True, 'result': resultado}).encode()
+
+
+def criar_update(bot, update_id, user_id, texto):
+    mensagem = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Paciente'},
+        'text': texto
+    }
+    if texto.startswith('/'):
+        comando = texto.split()[0]
+        mensagem['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(comando)}]
+    return Update.de_json({'update_id': update_id, 'message': mensagem}, bot)
+
+
+# --- Roteiros de Conversa ---
+def carregar_roteiros(caminho):
+    """Lê mensagens gravadas ({"user_id": ..., "text": ...} por linha) agrupadas por usuário."""
+    roteiros = defaultdict(list)
+    with open(caminho, encoding='utf-8') as arquivo:
+        for linha in arquivo:
+            if linha.strip():
+                mensagem = json.loads(linha)
+                roteiros[mensagem['user_id']].append(mensagem['text'])
+    return roteiros
+
+
+def _como_datetime(horario):
+    """Horário vindo do MySQL (TIME vira timedelta) ou texto 'hh:mm' como datetime."""
+    if isinstance(horario, timedelta):
+        return datetime(2000, 1, 1) + horario
+    return datetime.strptime(str(horario)[:5], '%H:%M')
+
+
+def gerar_roteiros(quantidade, semente=42):
+    """Gera conversas completas de agendamento (especialidade→data→horario→medico→nome)."""
+    agendas = bot_clinica.repositorio.listar_disponibilidades()
+    if not agendas:
+        raise SystemExit("Nenhuma disponibilidade de médico cadastrada no banco de replay "
+                         "(cadastre os médicos com adicionar_medico.py).")
+
+    especialidades = bot_clinica.catalogo.especialidades()
+    aleatorio = random.Random(semente)
+    hoje = datetime.now().date()
+    roteiros = {}
+    for i in range(quantidade):
+        agenda = aleatorio.choice(agendas)
+        dia = next(numero for numero, nome in DIAS_DA_SEMANA.items() if nome == agenda['dia_da_semana'])
+        # Datas e horários espalhados por meses para reduzir colisões entre os usuários sintéticos
+        data = hoje + timedelta(days=(dia - hoje.weekday()) % 7 + 7 * aleatorio.randint(1, 26))
+        inicio = _como_datetime(agenda['horario_inicio'])
+        fim = _como_datetime(agenda['horario_fim'])
+        horario = inicio + timedelta(minutes=15 * aleatorio.randint(0, max(0, (fim - inicio).seconds // 900 - 1)))
+        roteiros[PRIMEIRO_USER_ID_SINTETICO + i] = [
+            '/start',
+            'Agendar Consulta',
+            aleatorio.choice(especialidades),
+            data.strftime('%d/%m/%Y'),
+            horario.strftime('%H:%M'),
+            agenda['medico'],
+            f'Paciente Sintético {i}',
+            'Ver minhas consultas',
+            'Quais convênios são aceitos?'
+        ]
+    return roteiros
+
+
+def etapa_da_mensagem(user_id, texto):
+    """Rótulo usado no relatório: o comando enviado ou a etapa da conversa em que o usuário está."""
+    if texto.startswith('/'):
+        return texto.split()[0]
+    conversa = bot_clinica.conversas_em_andamento.get(user_id)
+    if conversa:
+        return conversa['etapa']
+    if texto in ('Agendar Consulta', 'Ver minhas consultas'):
+        return texto
+    return 'faq_nlp'
+
+
+# --- Execução ---
+async def reproduzir(roteiros, concorrencia, latencia_rede):
+    requisicao = RequisicaoFalsa(latencia_rede)
+    bot = Bot('1:REPLAY', request=requisicao, get_updates_request=requisicao)
+    application = ApplicationBuilder().bot(bot).updater(None).build()
+    bot_clinica.start_and_register_commands(application)
+
+    erros = []
+
+    async def contar_erro(update, context):
+        erros.append(context.error)
+
+    application.add_error_handler(contar_erro)
+    await application.initialize()
+
+    latencias = defaultdict(list)
+    vagas = asyncio.Semaphore(concorrencia)
+    proximo_update_id = iter(range(1, 10 ** 12))
+
+    async def conversar(user_id, mensagens):
+        async with vagas:
+            for texto in mensagens:
+                etapa = etapa_da_mensagem(user_id, texto)
+                update = criar_update(bot, next(proximo_update_id), user_id, texto)
+                inicio = time.perf_counter()
+                await application.process_update(update)
+                latencias[etapa].append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(conversar(user_id, mensagens) for user_id, mensagens in roteiros.items()))
+    duracao = time.perf_counter() - inicio
+    await application.shutdown()
+    return latencias, duracao, erros, requisicao.mensagens_enviadas
+
+
+def percentil(valores_ordenados, p):
+    indice = min(len(valores_ordenados) - 1, int(round(p / 100 * (len(valores_ordenados) - 1))))
+    return valores_ordenados[indice]
+
+
+def imprimir_relatorio(latencias, duracao, erros, mensagens_enviadas, usuarios):
+    total = sum(len(v) for v in latencias.values())
+    print(f"\nUsuários: {usuarios} | Atualizações: {total} | Respostas enviadas: {mensagens_enviadas} | Erros: {len(erros)}")
+    print(f"Duração: {duracao:.2f}s | Vazão: {total / duracao:.1f} atualizações/s\n")
+    print(f"{'etapa':<22}{'n':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'máx ms':>10}")
+    for etapa, valores in sorted(latencias.items(), key=lambda item: -sum(item[1])):
+        valores = sorted(valores)
+        print(f"{etapa:<22}{len(valores):>8}"
+              f"{percentil(valores, 50) * 1000:>10.1f}{percentil(valores, 90) * 1000:>10.1f}"
+              f"{percentil(valores, 99) * 1000:>10.1f}{valores[-1] * 1000:>10.1f}")
+    for erro in erros[:5]:
+        print(f"Erro: {erro!r}")
+
+
+def anotar_agendamentos_criados(repositorio):
+    """Guarda os ids criados pelos handlers, para apagar só o que o replay gravou."""
+    criados = []
+    criar_agendamento = repositorio.criar_agendamento
+
+    def criar_e_anotar(dados):
+        agendamento_id = criar_agendamento(dados)
+        criados.append(agendamento_id)
+        return agendamento_id
+
+    repositorio.criar_agendamento = criar_e_anotar
+    return criados
+
+
+def limpar_sinteticos(user_ids):
+    """Remove os agendamentos dos usuários sintéticos (inclusive os de replays interrompidos)."""
+    removidos = bot_clinica.repositorio.excluir_agendamentos_de_usuarios(user_ids)
+    print(f"{removidos} agendamentos sintéticos removidos.")
+
+
+def limpar_criados(ids, lote=500):
+    """Remove os agendamentos criados no replay de mensagens gravadas.
+
+    Os user_ids gravados são de pacientes reais: apagar por usuário levaria
+    junto os agendamentos que eles já tinham na cópia do banco.
+    """
+    removidos = 0
+    for inicio in range(0, len(ids), lote):
+        removidos += len(bot_clinica.repositorio.excluir_em_lote(ids[inicio:inicio + lote]))
+    print(f"{removidos} agendamentos do replay removidos.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay de conversas do bot da clínica.')
+    parser.add_argument('--arquivo', help='mensagens gravadas em JSON Lines ({"user_id": ..., "text": ...})')
+    parser.add_argument('--usuarios', type=int, default=1000, help='quantidade de usuários sintéticos')
+    parser.add_argument('--concorrencia', type=int, default=200, help='usuários conversando ao mesmo tempo')
+    parser.add_argument('--latencia-rede', type=float, default=0.0, help='atraso simulado de cada chamada ao Telegram (s)')
+    parser.add_argument('--manter', action='store_true', help='não apagar os agendamentos do replay ao final')
+    args = parser.parse_args()
+
+    # E-mails de confirmação não devem sair durante o replay
+    bot_clinica.enviar_email = lambda assunto, corpo: True
+
+    # Como o bot faz no main(): um banco novo (ex.: SQLite vazio) precisa das tabelas
+    try:
+        bot_clinica.repositorio.criar_tabelas()
+    except ErroDeBanco as err:
+        raise SystemExit(f"Não foi possível preparar o banco do replay: {err}")
+
+    roteiros = carregar_roteiros(args.arquivo) if args.arquivo else gerar_roteiros(args.usuarios)
+    criados = anotar_agendamentos_criados(bot_clinica.repositorio)
+    try:
+        latencias, duracao, erros, enviadas = asyncio.run(reproduzir(roteiros, args.concorrencia, args.latencia_rede))
+    finally:
+        if not args.manter:
+            if args.arquivo:
+                limpar_criados(criados)
+            else:
+                limpar_sinteticos(roteiros.keys())
+    imprimir_relatorio(latencias, duracao, erros, enviadas, len(roteiros))
+
+
+if __name__ == '__main__':
+    main()
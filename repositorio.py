@@ -0,0 +1,993 @@
+"""Camada de acesso a dados da clínica.
+
+As operações de agendamento, busca, disponibilidade, lembretes, catálogo,
+eventos e histórico são escritas uma única vez em `Repositorio`. Os backends
+só cuidam da conexão e das diferenças de dialeto SQL:
+
+  - `RepositorioMySQL`: servidor MySQL, com leituras roteadas para as réplicas
+    de DB_REPLICAS (ver banco.py);
+  - `RepositorioSQLite`: banco embutido em um arquivo, em modo WAL, para
+    clínicas pequenas e para rodar sem servidor.
+
+O backend é escolhido por CLINICA_BACKEND (mysql, o padrão, ou sqlite) e o
+arquivo do SQLite por SQLITE_PATH.
+"""
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from banco import RoteadorDeConexoes, replicas_do_ambiente
+from catalogo import Catalogo, tokens_do_nome
+
+logger = logging.getLogger(__name__)
+
+# Mapeamento manual dos dias da semana para não depender do locale do servidor
+DIAS_DA_SEMANA = {
+    0: 'Segunda-feira',
+    1: 'Terça-feira',
+    2: 'Quarta-feira',
+    3: 'Quinta-feira',
+    4: 'Sexta-feira',
+    5: 'Sábado',
+    6: 'Domingo'
+}
+
+ESPECIALIDADES_PADRAO = ['Cardiologia', 'Dermatologia', 'Ginecologia', 'Pediatria']
+
+TIPOS_DE_EVENTO = ('insert', 'update', 'delete')
+
+# Colunas copiadas de `agendamentos` para `agendamentos_historico`
+COLUNAS_AGENDAMENTO = ('id', 'nome', 'especialidade', 'data', 'horario', 'medico', 'medico_id', 'user_id', 'data_consulta')
+
+
+def dia_da_semana(data):
+    """'dd/mm/aaaa' -> nome do dia da semana como gravado em medico_disponibilidade."""
+    return DIAS_DA_SEMANA[datetime.strptime(data, '%d/%m/%Y').weekday()]
+
+
+def data_iso(data):
+    """'dd/mm/aaaa' -> 'aaaa-mm-dd', valor da coluna indexada `data_consulta` (None se inválida)."""
+    try:
+        return datetime.strptime(data, '%d/%m/%Y').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def _ordenar_por_data(agendamentos):
+    agendamentos.sort(key=lambda x: (
+        datetime.strptime(x['data'], '%d/%m/%Y'),
+        datetime.strptime(x['horario'], '%H:%M')
+    ))
+    return agendamentos
+
+
+class ErroDeBanco(Exception):
+    """Falha no banco de dados, qualquer que seja o backend."""
+
+
+class HorarioIndisponivel(Exception):
+    """O horário pedido não pode ser gravado; `motivo` é 'indisponivel' ou 'ocupado'."""
+
+    def __init__(self, motivo):
+        super().__init__(motivo)
+        self.motivo = motivo
+
+
+class Repositorio:
+    """Operações da clínica sobre um banco SQL; ver os backends abaixo."""
+
+    INSERT_IGNORE = 'INSERT IGNORE'
+    FOR_UPDATE = ' FOR UPDATE'
+    ERROS = ()
+
+    SELECT_AGENDAMENTO = """
+        SELECT a.id, a.nome, a.especialidade, a.data, a.horario, a.medico_id,
+               COALESCE(m.nome, a.medico) AS medico
+        FROM agendamentos a LEFT JOIN medicos m ON m.id = a.medico_id
+    """
+
+    # --- Pontos de extensão dos backends ---
+    def _conectar_escrita(self):
+        raise NotImplementedError
+
+    def _conectar_leitura(self, exigir_primario):
+        raise NotImplementedError
+
+    def _cursor(self, conn):
+        """Cursor que devolve as linhas como dicionários."""
+        raise NotImplementedError
+
+    def _liberar(self, conn):
+        conn.close()
+
+    def _iniciar_transacao(self, cursor):
+        pass
+
+    def _sql(self, query):
+        """Adapta a query (escrita com %s, como no mysql.connector) ao driver."""
+        return query
+
+    def _hoje(self):
+        raise NotImplementedError
+
+    def _dias_atras(self, dias):
+        """Expressão SQL do instante de `dias` dias atrás, comparável a `criado_em`."""
+        raise NotImplementedError
+
+    def criar_tabelas(self):
+        raise NotImplementedError
+
+    # --- Infraestrutura comum ---
+    def _executar(self, cursor, query, valores=()):
+        cursor.execute(self._sql(query), valores)
+
+    @contextmanager
+    def _transacao(self):
+        """Cursor no primário; commit no fim do bloco ou rollback em caso de erro."""
+        conn = None
+        try:
+            conn = self._conectar_escrita()
+            cursor = self._cursor(conn)
+            try:
+                self._iniciar_transacao(cursor)
+                yield cursor
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+        except self.ERROS as err:
+            raise ErroDeBanco(str(err)) from err
+        finally:
+            if conn is not None:
+                self._liberar(conn)
+
+    @contextmanager
+    def _leitura(self, exigir_primario=False):
+        """Cursor para leituras; vai para uma réplica quando o backend tiver réplicas."""
+        conn = None
+        try:
+            conn = self._conectar_leitura(exigir_primario)
+            cursor = self._cursor(conn)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+        except self.ERROS as err:
+            raise ErroDeBanco(str(err)) from err
+        finally:
+            if conn is not None:
+                self._liberar(conn)
+
+    def _marcadores(self, valores):
+        return ', '.join(['%s'] * len(valores))
+
+    # --- Agendamentos ---
+    def listar_agendamentos(self, termo_busca=None, exigir_primario=False):
+        """Agendamentos ordenados por data e horário, com filtro opcional por paciente, especialidade ou médico."""
+        query = self.SELECT_AGENDAMENTO
+        valores = ()
+        if termo_busca:
+            query += " WHERE a.nome LIKE %s OR a.especialidade LIKE %s OR COALESCE(m.nome, a.medico) LIKE %s"
+            valores = (f"%{termo_busca}%",) * 3
+        with self._leitura(exigir_primario) as cursor:
+            self._executar(cursor, query, valores)
+            return _ordenar_por_data(cursor.fetchall())
+
+    def buscar_agendamento(self, agendamento_id, exigir_primario=False):
+        with self._leitura(exigir_primario) as cursor:
+            self._executar(cursor, self.SELECT_AGENDAMENTO + " WHERE a.id = %s", (agendamento_id,))
+            return cursor.fetchone()
+
+    def consultas_do_usuario(self, user_id, exigir_primario=False):
+        with self._leitura(exigir_primario) as cursor:
+            self._executar(cursor, self.SELECT_AGENDAMENTO + " WHERE a.user_id = %s", (user_id,))
+            return cursor.fetchall()
+
+    def nome_do_usuario(self, user_id, exigir_primario=False):
+        """Nome usado pelo paciente no último agendamento, ou None se ele nunca agendou."""
+        with self._leitura(exigir_primario) as cursor:
+            self._executar(cursor, "SELECT nome FROM agendamentos WHERE user_id = %s LIMIT 1", (user_id,))
+            linha = cursor.fetchone()
+        return linha['nome'] if linha else None
+
+    def consultas_para_lembrete(self, data):
+        """Consultas de uma data com o user_id do Telegram, para os lembretes."""
+        query = """
+            SELECT a.user_id, a.especialidade, a.data, a.horario, COALESCE(m.nome, a.medico) AS medico
+            FROM agendamentos a LEFT JOIN medicos m ON m.id = a.medico_id
+            WHERE a.data = %s
+        """
+        with self._leitura() as cursor:
+            self._executar(cursor, query, (data,))
+            return cursor.fetchall()
+
+    def _atende(self, cursor, medico_id, data, horario):
+        query = """
+            SELECT 1 FROM medico_disponibilidade
+            WHERE medico_id = %s AND dia_da_semana = %s AND horario_inicio <= %s AND horario_fim >= %s
+            LIMIT 1
+        """
+        self._executar(cursor, query, (medico_id, dia_da_semana(data), horario, horario))
+        return cursor.fetchone() is not None
+
+    def _motivo_de_recusa(self, cursor, medico_id, data, horario, ignorar_id=None, travar=False):
+        if not self._atende(cursor, medico_id, data, horario):
+            return 'indisponivel'
+        query = "SELECT 1 FROM agendamentos WHERE data = %s AND horario = %s AND medico_id = %s"
+        valores = (data, horario, medico_id)
+        if ignorar_id:
+            query += " AND id != %s"
+            valores += (ignorar_id,)
+        self._executar(cursor, query + " LIMIT 1" + (self.FOR_UPDATE if travar else ''), valores)
+        if cursor.fetchone():
+            return 'ocupado'
+        return None
+
+    def verificar_disponibilidade(self, medico_id, data, horario, ignorar_id=None):
+        """None se o horário estiver livre; 'indisponivel' ou 'ocupado' caso contrário.
+
+        Sempre consulta o primário, pois costuma anteceder uma gravação. É só um
+        aviso antecipado: criar_agendamento valida de novo ao gravar.
+        """
+        with self._leitura(exigir_primario=True) as cursor:
+            return self._motivo_de_recusa(cursor, medico_id, data, horario, ignorar_id)
+
+    def criar_agendamento(self, dados):
+        """Grava um agendamento (nome, especialidade, medico, medico_id, data, horario e user_id opcional).
+
+        O expediente do médico e o horário livre são validados na mesma transação
+        do INSERT; se o horário não puder ser gravado, levanta HorarioIndisponivel.
+        """
+        query = """
+            INSERT INTO agendamentos (nome, especialidade, data, horario, medico, medico_id, user_id, data_consulta)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        with self._transacao() as cursor:
+            # FOR UPDATE: no MySQL, trava a lacuna do horário em idx_agendamentos_medico até o commit
+            motivo = self._motivo_de_recusa(cursor, dados['medico_id'], dados['data'], dados['horario'], travar=True)
+            if motivo:
+                raise HorarioIndisponivel(motivo)
+            self._executar(cursor, query, (
+                dados['nome'], dados['especialidade'], dados['data'], dados['horario'],
+                dados['medico'], dados['medico_id'], dados.get('user_id'), data_iso(dados['data'])
+            ))
+            agendamento_id = cursor.lastrowid
+            self._registrar_evento(cursor, 'insert', agendamento_id, {
+                'id': agendamento_id, 'nome': dados['nome'], 'especialidade': dados['especialidade'],
+                'medico': dados['medico'], 'medico_id': dados['medico_id'],
+                'data': dados['data'], 'horario': dados['horario']
+            })
+        return agendamento_id
+
+    def atualizar_agendamento(self, agendamento_id, dados):
+        query = """
+            UPDATE agendamentos SET nome = %s, especialidade = %s, medico = %s, medico_id = %s, data = %s, horario = %s,
+                   data_consulta = %s
+            WHERE id = %s
+        """
+        with self._transacao() as cursor:
+            self._executar(cursor, query, (
+                dados['nome'], dados['especialidade'], dados['medico'], dados['medico_id'],
+                dados['data'], dados['horario'], data_iso(dados['data']), agendamento_id
+            ))
+            atualizado = cursor.rowcount > 0
+            if atualizado:
+                self._registrar_evento(cursor, 'update', agendamento_id, dict(dados, id=agendamento_id))
+        return atualizado
+
+    def excluir_agendamento(self, agendamento_id, user_id=None):
+        """Exclui e retorna o agendamento (ou None). Com `user_id`, só exclui se pertencer ao usuário."""
+        query = "SELECT * FROM agendamentos WHERE id = %s"
+        valores = (agendamento_id,)
+        if user_id is not None:
+            query += " AND user_id = %s"
+            valores += (user_id,)
+        with self._transacao() as cursor:
+            self._executar(cursor, query + self.FOR_UPDATE, valores)
+            agendamento = cursor.fetchone()
+            if agendamento:
+                self._executar(cursor, "DELETE FROM agendamentos WHERE id = %s", (agendamento_id,))
+                self._registrar_evento(cursor, 'delete', agendamento_id, {'id': agendamento_id})
+        return agendamento
+
+    def excluir_em_lote(self, ids):
+        """Exclui os ids em uma transação e retorna o conjunto dos que existiam."""
+        with self._transacao() as cursor:
+            self._executar(cursor, f"SELECT id FROM agendamentos WHERE id IN ({self._marcadores(ids)})" + self.FOR_UPDATE, ids)
+            existentes = [linha['id'] for linha in cursor.fetchall()]
+            if existentes:
+                self._executar(cursor, f"DELETE FROM agendamentos WHERE id IN ({self._marcadores(existentes)})", existentes)
+                for agendamento_id in existentes:
+                    self._registrar_evento(cursor, 'delete', agendamento_id, {'id': agendamento_id})
+        return set(existentes)
+
+    def excluir_agendamentos_de_usuarios(self, user_ids, lote=500):
+        """Remove todos os agendamentos dos usuários informados; retorna quantos foram removidos."""
+        user_ids = list(user_ids)
+        total = 0
+        for inicio in range(0, len(user_ids), lote):
+            parte = user_ids[inicio:inicio + lote]
+            with self._transacao() as cursor:
+                self._executar(cursor, f"SELECT id FROM agendamentos WHERE user_id IN ({self._marcadores(parte)})"
+                               + self.FOR_UPDATE, parte)
+                existentes = [linha['id'] for linha in cursor.fetchall()]
+                if existentes:
+                    self._executar(cursor, f"DELETE FROM agendamentos WHERE id IN ({self._marcadores(existentes)})", existentes)
+                    for agendamento_id in existentes:
+                        self._registrar_evento(cursor, 'delete', agendamento_id, {'id': agendamento_id})
+                total += len(existentes)
+        return total
+
+    def reagendar_em_lote(self, ids, data, medico_id=None, horarios=None):
+        """Move os agendamentos para `data` em uma transação, validando todos de uma vez.
+
+        Cada agendamento mantém seu horário, a menos que outro seja dado em
+        `horarios` ({id: 'hh:mm'}), e seu médico, a menos que `medico_id` seja
+        informado. Retorna um resultado por id, com `status` 'reagendado',
+        'nao_encontrado', 'indisponivel' ou 'ocupado'.
+        """
+        horarios = horarios or {}
+        resultados = {}
+        with self._transacao() as cursor:
+            self._executar(cursor, f"""
+                SELECT id, nome, especialidade, data, horario, medico_id FROM agendamentos
+                WHERE id IN ({self._marcadores(ids)})
+            """ + self.FOR_UPDATE, ids)
+            atuais = {linha['id']: linha for linha in cursor.fetchall()}
+
+            destinos = {}
+            for agendamento_id in ids:
+                atual = atuais.get(agendamento_id)
+                if not atual:
+                    resultados[agendamento_id] = {'id': agendamento_id, 'status': 'nao_encontrado'}
+                    continue
+                destinos[agendamento_id] = (
+                    medico_id or atual['medico_id'],
+                    horarios.get(agendamento_id, horarios.get(str(agendamento_id), atual['horario']))
+                )
+
+            if destinos:
+                # 1. Expediente dos médicos: uma consulta para todos os destinos
+                linhas = ' UNION ALL '.join(['SELECT %s AS id, %s AS medico_id, %s AS horario'] * len(destinos))
+                self._executar(cursor, f"""
+                    SELECT c.id FROM ({linhas}) c
+                    WHERE EXISTS (
+                        SELECT 1 FROM medico_disponibilidade d
+                        WHERE d.medico_id = c.medico_id AND d.dia_da_semana = %s
+                          AND d.horario_inicio <= c.horario AND d.horario_fim >= c.horario
+                    )
+                """, [v for i, (m, h) in destinos.items() for v in (i, m, h)] + [dia_da_semana(data)])
+                disponiveis = {linha['id'] for linha in cursor.fetchall()}
+
+                # 2. Quem ocupa cada horário dos médicos de destino na nova data, inclusive
+                # os agendamentos do lote que já estão nela: cada um segura o próprio
+                # horário até ser de fato movido (quem falhar continua onde está).
+                medicos = list({m for m, _ in destinos.values()})
+                # FOR UPDATE: no MySQL, trava também as lacunas do índice (medico_id, data, horario),
+                # para que ninguém grave nesses horários antes do commit
+                self._executar(cursor, f"""
+                    SELECT id, medico_id, horario FROM agendamentos
+                    WHERE data = %s AND medico_id IN ({self._marcadores(medicos)})
+                """ + self.FOR_UPDATE, [data] + medicos)
+                ocupados = {}
+                for linha in cursor.fetchall():
+                    ocupados.setdefault((linha['medico_id'], linha['horario']), set()).add(linha['id'])
+
+                self._executar(cursor, f"SELECT id, nome FROM medicos WHERE id IN ({self._marcadores(medicos)})", medicos)
+                nomes = {linha['id']: linha['nome'] for linha in cursor.fetchall()}
+
+                atualizacoes = []
+                for agendamento_id, (novo_medico_id, horario) in destinos.items():
+                    resultado = {'id': agendamento_id, 'medico_id': novo_medico_id, 'data': data, 'horario': horario}
+                    if agendamento_id not in disponiveis:
+                        resultado['status'] = 'indisponivel'
+                    elif ocupados.get((novo_medico_id, horario), set()) - {agendamento_id}:
+                        resultado['status'] = 'ocupado'
+                    else:
+                        # Libera o horário antigo e reserva o novo, para que outro agendamento do lote não caia nele
+                        atual = atuais[agendamento_id]
+                        if atual['data'] == data:
+                            ocupados.get((atual['medico_id'], atual['horario']), set()).discard(agendamento_id)
+                        ocupados.setdefault((novo_medico_id, horario), set()).add(agendamento_id)
+                        resultado['status'] = 'reagendado'
+                        atualizacoes.append((data, data_iso(data), horario, novo_medico_id, nomes.get(novo_medico_id), agendamento_id))
+                    resultados[agendamento_id] = resultado
+
+                if atualizacoes:
+                    cursor.executemany(
+                        self._sql("""
+                            UPDATE agendamentos SET data = %s, data_consulta = %s, horario = %s, medico_id = %s, medico = %s
+                            WHERE id = %s
+                        """),
+                        atualizacoes
+                    )
+                    for nova_data, _, horario, novo_medico_id, medico_nome, agendamento_id in atualizacoes:
+                        atual = atuais[agendamento_id]
+                        self._registrar_evento(cursor, 'update', agendamento_id, {
+                            'id': agendamento_id, 'nome': atual['nome'], 'especialidade': atual['especialidade'],
+                            'medico': medico_nome, 'medico_id': novo_medico_id, 'data': nova_data, 'horario': horario
+                        })
+        return [resultados[i] for i in ids]
+
+    # --- Eventos (feed de mudanças) ---
+    def _registrar_evento(self, cursor, tipo, agendamento_id, dados=None):
+        """Grava o evento na mesma transação da escrita em `agendamentos`."""
+        if tipo not in TIPOS_DE_EVENTO:
+            raise ValueError(f"Tipo de evento inválido: {tipo}")
+        dados_json = json.dumps(dados, default=str) if dados is not None else None
+        self._executar(cursor, "INSERT INTO agendamentos_eventos (tipo, agendamento_id, dados) VALUES (%s, %s, %s)",
+                       (tipo, agendamento_id, dados_json))
+
+    def ler_eventos(self, ultimo_id, limite=500):
+        """Eventos com id maior que `ultimo_id`; na primeira leitura (0), só os mais recentes.
+
+        Os ids são alocados no INSERT, não no commit: um id menor pode aparecer
+        depois de um maior. Quem lê trata as lacunas (ver eventos.LeitorDeEventos).
+        """
+        if ultimo_id == 0:
+            query = """
+                SELECT * FROM (
+                    SELECT id, tipo, agendamento_id, dados FROM agendamentos_eventos
+                    ORDER BY id DESC LIMIT %s
+                ) recentes ORDER BY id
+            """
+            valores = (limite,)
+        else:
+            query = """
+                SELECT id, tipo, agendamento_id, dados FROM agendamentos_eventos
+                WHERE id > %s ORDER BY id LIMIT %s
+            """
+            valores = (ultimo_id, limite)
+        # No primário: uma réplica atrasada faria o leitor pular eventos
+        with self._leitura(exigir_primario=True) as cursor:
+            self._executar(cursor, query, valores)
+            eventos = cursor.fetchall()
+        for evento in eventos:
+            evento['dados'] = json.loads(evento['dados']) if evento['dados'] else None
+        return eventos
+
+    def podar_eventos(self, dias=7, manter=1000, lote=5000):
+        """Apaga os eventos com mais de `dias` dias, preservando sempre os `manter` mais recentes.
+
+        O feed só reenvia o que cabe no próprio buffer (eventos.FeedDeAgendamentos,
+        1000 por padrão), e os eventos guardam nomes de pacientes: não há motivo
+        para mantê-los além disso. Retorna quantos foram apagados.
+        """
+        with self._leitura(exigir_primario=True) as cursor:
+            self._executar(cursor, "SELECT MAX(id) AS maximo FROM agendamentos_eventos")
+            maximo = cursor.fetchone()['maximo']
+        if maximo is None:
+            return 0
+        total = 0
+        while True:
+            with self._transacao() as cursor:
+                self._executar(cursor, f"""
+                    SELECT id FROM agendamentos_eventos
+                    WHERE id <= %s AND criado_em < {self._dias_atras(dias)}
+                    ORDER BY id LIMIT %s
+                """, (maximo - manter, lote))
+                ids = [linha['id'] for linha in cursor.fetchall()]
+                if not ids:
+                    break
+                self._executar(cursor, f"DELETE FROM agendamentos_eventos WHERE id IN ({self._marcadores(ids)})", ids)
+            total += len(ids)
+        return total
+
+    # --- Catálogo de médicos e especialidades ---
+    def carregar_catalogo(self):
+        """Retorna (especialidades, medicos) para o índice em memória do catálogo."""
+        with self._leitura() as cursor:
+            self._executar(cursor, "SELECT id, nome FROM especialidades ORDER BY nome")
+            especialidades = cursor.fetchall()
+            self._executar(cursor, """
+                SELECT m.id, m.nome, m.especialidade_id, e.nome AS especialidade
+                FROM medicos m LEFT JOIN especialidades e ON e.id = m.especialidade_id
+            """)
+            medicos = cursor.fetchall()
+        return especialidades, medicos
+
+    def assinatura_catalogo(self):
+        """Consulta leve que muda sempre que médicos ou especialidades mudam."""
+        with self._leitura() as cursor:
+            self._executar(cursor, """
+                SELECT (SELECT COUNT(*) FROM medicos) AS medicos, (SELECT MAX(atualizado_em) FROM medicos) AS medicos_em,
+                       (SELECT COUNT(*) FROM especialidades) AS especialidades,
+                       (SELECT MAX(atualizado_em) FROM especialidades) AS especialidades_em
+            """)
+            linha = cursor.fetchone()
+        return tuple(str(valor) for valor in linha.values())
+
+    def listar_disponibilidades(self):
+        with self._leitura() as cursor:
+            self._executar(cursor, """
+                SELECT d.medico_id, m.nome AS medico, d.dia_da_semana, d.horario_inicio, d.horario_fim
+                FROM medico_disponibilidade d JOIN medicos m ON m.id = d.medico_id
+            """)
+            return cursor.fetchall()
+
+    def adicionar_medico(self, nome, dia, inicio, fim, especialidade=None):
+        """Cadastra (ou atualiza) o médico no catálogo e acrescenta uma faixa de disponibilidade."""
+        with self._transacao() as cursor:
+            especialidade_id = None
+            if especialidade:
+                self._executar(cursor, f"{self.INSERT_IGNORE} INTO especialidades (nome) VALUES (%s)", (especialidade,))
+                self._executar(cursor, "SELECT id FROM especialidades WHERE nome = %s", (especialidade,))
+                especialidade_id = cursor.fetchone()['id']
+            self._executar(cursor, "SELECT id FROM medicos WHERE nome = %s" + self.FOR_UPDATE, (nome,))
+            medico = cursor.fetchone()
+            if not medico:
+                # 'Carlos' depois de 'Dr. Carlos' é o mesmo médico, como na migração (_migrar_medicos)
+                tokens = tokens_do_nome(nome)
+                self._executar(cursor, "SELECT id, nome FROM medicos" + self.FOR_UPDATE)
+                medico = next((m for m in cursor.fetchall() if tokens and tokens_do_nome(m['nome']) == tokens), None)
+            if medico:
+                medico_id = medico['id']
+                # atualizado_em avisa os catálogos dos outros processos
+                self._executar(cursor, """
+                    UPDATE medicos SET especialidade_id = COALESCE(%s, especialidade_id), atualizado_em = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                """, (especialidade_id, medico_id))
+            else:
+                self._executar(cursor, "INSERT INTO medicos (nome, especialidade_id) VALUES (%s, %s)", (nome, especialidade_id))
+                medico_id = cursor.lastrowid
+            self._executar(cursor, """
+                INSERT INTO medico_disponibilidade (medico_id, medico_nome, dia_da_semana, horario_inicio, horario_fim)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (medico_id, nome, dia, inicio, fim))
+        return medico_id
+
+    def _semear_especialidades(self, cursor):
+        for nome in ESPECIALIDADES_PADRAO:
+            self._executar(cursor, f"{self.INSERT_IGNORE} INTO especialidades (nome) VALUES (%s)", (nome,))
+
+    def _migrar_medicos(self):
+        """Cadastra os médicos de bancos antigos (nome em texto livre) e liga as disponibilidades a eles.
+
+        O mesmo médico aparece escrito de formas diferentes ('Dr. Carlos' pelo
+        adicionar_medico.py, 'Carlos' em outros pontos): os nomes são agrupados
+        pelos tokens, sem o prefixo, para virar um único cadastro.
+        """
+        with self._transacao() as cursor:
+            self._executar(cursor, """
+                SELECT DISTINCT medico_nome FROM medico_disponibilidade
+                WHERE medico_id IS NULL AND medico_nome IS NOT NULL
+            """)
+            grupos = {}
+            for linha in cursor.fetchall():
+                tokens = tuple(tokens_do_nome(linha['medico_nome']))
+                if tokens:
+                    grupos.setdefault(tokens, []).append(linha['medico_nome'])
+            if not grupos:
+                return
+            self._executar(cursor, "SELECT id, nome FROM medicos")
+            cadastrados = {tuple(tokens_do_nome(m['nome'])): m['id'] for m in cursor.fetchall()}
+            for tokens, nomes in grupos.items():
+                medico_id = cadastrados.get(tokens)
+                if medico_id is None:
+                    # A forma mais completa (com 'Dr.'/'Dra.') vira o nome do cadastro
+                    self._executar(cursor, "INSERT INTO medicos (nome) VALUES (%s)", (max(nomes, key=len),))
+                    medico_id = cursor.lastrowid
+                self._executar(cursor, f"""
+                    UPDATE medico_disponibilidade SET medico_id = %s
+                    WHERE medico_id IS NULL AND medico_nome IN ({self._marcadores(nomes)})
+                """, (medico_id, *nomes))
+
+    def _associar_medicos_antigos(self):
+        """Liga agendamentos antigos (médico em texto livre) ao cadastro pelo resolvedor do catálogo."""
+        catalogo = Catalogo(self)
+        with self._transacao() as cursor:
+            cursor.execute("SELECT DISTINCT medico FROM agendamentos WHERE medico_id IS NULL")
+            for linha in cursor.fetchall():
+                texto = linha['medico']
+                candidatos = catalogo.resolver_medico(texto or '')
+                if len(candidatos) == 1:
+                    self._executar(cursor, "UPDATE agendamentos SET medico_id = %s WHERE medico_id IS NULL AND medico = %s",
+                                   (candidatos[0]['id'], texto))
+                else:
+                    logger.warning(f"Não foi possível associar o médico '{texto}' a um cadastro ({len(candidatos)} candidatos).")
+
+    # --- Histórico ---
+    def arquivar_passados(self, lote=1000):
+        """Move para o histórico, em lotes, as consultas anteriores a hoje. Retorna quantas foram movidas.
+
+        Cada lote é uma busca por faixa no índice de `data_consulta`: a coluna
+        `data` (texto dd/mm/aaaa) só poderia ser comparada convertendo linha a
+        linha, o que varreria a tabela inteira a cada lote.
+        """
+        colunas = ', '.join(COLUNAS_AGENDAMENTO)
+        total = 0
+        while True:
+            # Um commit por lote mantém as transações curtas e não trava a tabela quente
+            with self._transacao() as cursor:
+                self._executar(cursor, f"""
+                    SELECT id FROM agendamentos WHERE data_consulta < {self._hoje()} LIMIT %s
+                """, (lote,))
+                ids = [linha['id'] for linha in cursor.fetchall()]
+                if not ids:
+                    break
+                marcadores = self._marcadores(ids)
+                self._executar(cursor, f"""
+                    INSERT INTO agendamentos_historico ({colunas})
+                    SELECT {colunas} FROM agendamentos WHERE id IN ({marcadores})
+                """, ids)
+                self._executar(cursor, f"DELETE FROM agendamentos WHERE id IN ({marcadores})", ids)
+                # Para o feed, a consulta arquivada saiu da agenda
+                for agendamento_id in ids:
+                    self._registrar_evento(cursor, 'delete', agendamento_id, {'id': agendamento_id})
+            total += len(ids)
+        return total
+
+    def buscar_historico(self, user_id=None, termo_busca=None, limite=50, deslocamento=0):
+        """Consulta explícita ao histórico (consultas já realizadas), da mais recente para a mais antiga."""
+        query = """
+            SELECT h.id, h.nome, h.especialidade, h.data, h.horario, h.medico_id,
+                   COALESCE(m.nome, h.medico) AS medico, h.arquivado_em
+            FROM agendamentos_historico h LEFT JOIN medicos m ON m.id = h.medico_id
+        """
+        condicoes = []
+        valores = []
+        if user_id is not None:
+            condicoes.append("h.user_id = %s")
+            valores.append(user_id)
+        if termo_busca:
+            condicoes.append("(h.nome LIKE %s OR h.especialidade LIKE %s OR COALESCE(m.nome, h.medico) LIKE %s)")
+            valores.extend([f"%{termo_busca}%"] * 3)
+        if condicoes:
+            query += " WHERE " + " AND ".join(condicoes)
+        query += " ORDER BY h.data_consulta DESC, h.horario DESC LIMIT %s OFFSET %s"
+        valores.extend([limite, deslocamento])
+        with self._leitura() as cursor:
+            self._executar(cursor, query, valores)
+            return cursor.fetchall()
+
+
+# --- Backend MySQL ---
+class RepositorioMySQL(Repositorio):
+    """MySQL com escritas no primário e leituras nas réplicas de DB_REPLICAS."""
+
+    def __init__(self, config, replicas=None):
+        import mysql.connector
+        self.ERROS = (mysql.connector.Error,)
+        self.config = config
+        self.roteador = RoteadorDeConexoes(
+            config, replicas if replicas is not None else replicas_do_ambiente(config), conectar=mysql.connector.connect,
+            atraso_maximo=float(os.getenv('DB_REPLICA_ATRASO_MAXIMO', '5'))
+        )
+
+    def _conectar_escrita(self):
+        return self.roteador.escrita()
+
+    def _conectar_leitura(self, exigir_primario):
+        return self.roteador.leitura(exigir_primario)
+
+    def _cursor(self, conn):
+        return conn.cursor(dictionary=True)
+
+    def _hoje(self):
+        return "CURDATE()"
+
+    def _dias_atras(self, dias):
+        return f"NOW() - INTERVAL {int(dias)} DAY"
+
+    def _coluna_existe(self, cursor, tabela, coluna):
+        self._executar(cursor, """
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        """, (tabela, coluna))
+        return cursor.fetchone() is not None
+
+    def _indice_existe(self, cursor, tabela, indice):
+        self._executar(cursor, """
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1
+        """, (tabela, indice))
+        return cursor.fetchone() is not None
+
+    def criar_tabelas(self):
+        """Cria as tabelas que faltarem e migra bancos antigos (médico em texto livre, sem índices)."""
+        with self._transacao() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS agendamentos (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    nome VARCHAR(255) NOT NULL,
+                    especialidade VARCHAR(100),
+                    data VARCHAR(10) NOT NULL,
+                    horario VARCHAR(5) NOT NULL,
+                    medico VARCHAR(100),
+                    medico_id INT NULL,
+                    user_id BIGINT NULL,
+                    data_consulta DATE NULL
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS medico_disponibilidade (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    medico_nome VARCHAR(100),
+                    medico_id INT NULL,
+                    dia_da_semana VARCHAR(20) NOT NULL,
+                    horario_inicio VARCHAR(5) NOT NULL,
+                    horario_fim VARCHAR(5) NOT NULL
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS especialidades (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    nome VARCHAR(100) NOT NULL UNIQUE,
+                    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS medicos (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    nome VARCHAR(100) NOT NULL UNIQUE,
+                    especialidade_id INT NULL,
+                    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    FOREIGN KEY (especialidade_id) REFERENCES especialidades(id)
+                )
+            """)
+            # O id auto-incremento é o id do evento no SSE (retomada pelo Last-Event-ID)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS agendamentos_eventos (
+                    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                    tipo VARCHAR(10) NOT NULL,
+                    agendamento_id INT NOT NULL,
+                    dados TEXT,
+                    criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            self._semear_especialidades(cursor)
+
+            # Bancos criados antes do catálogo: médico só em texto livre
+            if not self._coluna_existe(cursor, 'medico_disponibilidade', 'medico_id'):
+                cursor.execute("ALTER TABLE medico_disponibilidade ADD COLUMN medico_id INT NULL")
+            if not self._coluna_existe(cursor, 'agendamentos', 'medico_id'):
+                cursor.execute("ALTER TABLE agendamentos ADD COLUMN medico_id INT NULL")
+            # `data` é texto dd/mm/aaaa; a cópia em DATE é o que os índices conseguem ordenar
+            if not self._coluna_existe(cursor, 'agendamentos', 'data_consulta'):
+                cursor.execute("ALTER TABLE agendamentos ADD COLUMN data_consulta DATE NULL")
+            indices = {
+                ('medico_disponibilidade', 'idx_disponibilidade_medico'): "(medico_id, dia_da_semana)",
+                ('agendamentos', 'idx_agendamentos_medico'): "(medico_id, data, horario)",
+                ('agendamentos', 'idx_agendamentos_data'): "(data)",
+                ('agendamentos', 'idx_agendamentos_user'): "(user_id)",
+                ('agendamentos', 'idx_agendamentos_data_consulta'): "(data_consulta)",
+                ('agendamentos_eventos', 'idx_eventos_criado_em'): "(criado_em)",
+            }
+            for (tabela, indice), colunas in indices.items():
+                if not self._indice_existe(cursor, tabela, indice):
+                    cursor.execute(f"ALTER TABLE {tabela} ADD INDEX {indice} {colunas}")
+
+            # Histórico com a mesma estrutura da tabela quente
+            cursor.execute("CREATE TABLE IF NOT EXISTS agendamentos_historico LIKE agendamentos")
+            if not self._coluna_existe(cursor, 'agendamentos_historico', 'medico_id'):
+                cursor.execute("ALTER TABLE agendamentos_historico ADD COLUMN medico_id INT NULL")
+            if not self._coluna_existe(cursor, 'agendamentos_historico', 'arquivado_em'):
+                cursor.execute("ALTER TABLE agendamentos_historico ADD COLUMN arquivado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+            if not self._coluna_existe(cursor, 'agendamentos_historico', 'data_consulta'):
+                cursor.execute("ALTER TABLE agendamentos_historico ADD COLUMN data_consulta DATE NULL")
+            if not self._indice_existe(cursor, 'agendamentos_historico', 'idx_historico_usuario_data'):
+                cursor.execute("ALTER TABLE agendamentos_historico ADD INDEX idx_historico_usuario_data (user_id, data_consulta)")
+
+            # Linhas gravadas antes da coluna existir (ou por versões antigas ainda no ar).
+            # IGNORE: datas inválidas ficam NULL em vez de abortar a migração no modo estrito.
+            for tabela in ('agendamentos', 'agendamentos_historico'):
+                cursor.execute(f"""
+                    UPDATE IGNORE {tabela} SET data_consulta = STR_TO_DATE(data, '%d/%m/%Y')
+                    WHERE data_consulta IS NULL
+                """)
+
+        self._migrar_medicos()
+        self._associar_medicos_antigos()
+
+
+# --- Backend SQLite ---
+class RepositorioSQLite(Repositorio):
+    """Banco embutido em um arquivo, sem servidor.
+
+    As conexões são abertas uma única vez e reaproveitadas: uma conexão de
+    escrita, usada por uma thread de cada vez (o SQLite só tem um escritor), e
+    um pool de até `max_leitores` conexões de leitura, que em modo WAL não
+    bloqueiam o escritor. Como as queries são sempre as mesmas strings
+    parametrizadas, o cache de statements de cada conexão as mantém preparadas
+    entre as requisições, qualquer que seja a thread. Use um arquivo, não
+    ':memory:', pois cada conexão em memória seria um banco diferente.
+    """
+
+    INSERT_IGNORE = 'INSERT OR IGNORE'
+    FOR_UPDATE = ''
+    ERROS = (sqlite3.Error,)
+
+    def __init__(self, caminho='clinica.db', max_leitores=4, statements_em_cache=256, espera_conexao=30):
+        self.caminho = caminho
+        self.max_leitores = max_leitores
+        self.statements_em_cache = statements_em_cache
+        self.espera_conexao = espera_conexao
+        self._traducoes = {}
+        self._lock_escrita = threading.Lock()
+        self._escritor = None
+        self._leitores = queue.LifoQueue()
+        self._lock_leitores = threading.Lock()
+        self._leitores_abertos = 0
+
+    def _abrir(self):
+        # isolation_level=None: as transações são abertas explicitamente com BEGIN IMMEDIATE;
+        # check_same_thread=False: a conexão passa de uma thread para outra pelo pool
+        conn = sqlite3.connect(self.caminho, timeout=self.espera_conexao, isolation_level=None,
+                               check_same_thread=False, cached_statements=self.statements_em_cache)
+        conn.row_factory = lambda cursor, linha: {c[0]: v for c, v in zip(cursor.description, linha)}
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.create_function('data_iso', 1, data_iso, deterministic=True)
+        return conn
+
+    def _conectar_escrita(self):
+        if not self._lock_escrita.acquire(timeout=self.espera_conexao):
+            raise sqlite3.OperationalError("Tempo esgotado aguardando a conexão de escrita.")
+        try:
+            if self._escritor is None:
+                self._escritor = self._abrir()
+            return self._escritor
+        except BaseException:
+            self._lock_escrita.release()
+            raise
+
+    def _conectar_leitura(self, exigir_primario):
+        # Todas as conexões leem o mesmo arquivo: `exigir_primario` não muda nada aqui
+        try:
+            return self._leitores.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock_leitores:
+            abrir = self._leitores_abertos < self.max_leitores
+            if abrir:
+                self._leitores_abertos += 1
+        if abrir:
+            try:
+                return self._abrir()
+            except BaseException:
+                with self._lock_leitores:
+                    self._leitores_abertos -= 1
+                raise
+        try:
+            return self._leitores.get(timeout=self.espera_conexao)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Tempo esgotado aguardando uma conexão de leitura.") from None
+
+    def _cursor(self, conn):
+        return conn.cursor()
+
+    def _liberar(self, conn):
+        # As conexões voltam para o uso seguinte (e com elas os statements preparados)
+        if conn is self._escritor:
+            self._lock_escrita.release()
+        else:
+            self._leitores.put(conn)
+
+    def _iniciar_transacao(self, cursor):
+        # Reserva a escrita já no início: a validação do horário em criar_agendamento
+        # e o INSERT que vem depois dela ficam atômicos
+        cursor.execute("BEGIN IMMEDIATE")
+
+    def _sql(self, query):
+        traduzida = self._traducoes.get(query)
+        if traduzida is None:
+            traduzida = query.replace('%%', '\0').replace('%s', '?').replace('\0', '%')
+            self._traducoes[query] = traduzida
+        return traduzida
+
+    def _hoje(self):
+        return "date('now', 'localtime')"
+
+    def _dias_atras(self, dias):
+        # CURRENT_TIMESTAMP (default de `criado_em`) é UTC no SQLite, assim como datetime('now')
+        return f"datetime('now', '-{int(dias)} days')"
+
+    def fechar(self):
+        """Fecha as conexões ociosas; chame quando nenhuma operação estiver em andamento."""
+        with self._lock_escrita:
+            if self._escritor is not None:
+                self._escritor.close()
+                self._escritor = None
+        while True:
+            try:
+                conn = self._leitores.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock_leitores:
+                self._leitores_abertos -= 1
+
+    def criar_tabelas(self):
+        with self._transacao() as cursor:
+            for ddl in (
+                """CREATE TABLE IF NOT EXISTS especialidades (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nome TEXT NOT NULL UNIQUE,
+                    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )""",
+                """CREATE TABLE IF NOT EXISTS medicos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nome TEXT NOT NULL UNIQUE,
+                    especialidade_id INTEGER NULL REFERENCES especialidades(id),
+                    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )""",
+                """CREATE TABLE IF NOT EXISTS agendamentos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nome TEXT NOT NULL,
+                    especialidade TEXT,
+                    data TEXT NOT NULL,
+                    horario TEXT NOT NULL,
+                    medico TEXT,
+                    medico_id INTEGER NULL,
+                    user_id INTEGER NULL,
+                    data_consulta TEXT NULL
+                )""",
+                """CREATE TABLE IF NOT EXISTS medico_disponibilidade (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    medico_nome TEXT,
+                    medico_id INTEGER NULL,
+                    dia_da_semana TEXT NOT NULL,
+                    horario_inicio TEXT NOT NULL,
+                    horario_fim TEXT NOT NULL
+                )""",
+                """CREATE TABLE IF NOT EXISTS agendamentos_eventos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tipo TEXT NOT NULL,
+                    agendamento_id INTEGER NOT NULL,
+                    dados TEXT,
+                    criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )""",
+                """CREATE TABLE IF NOT EXISTS agendamentos_historico (
+                    id INTEGER PRIMARY KEY,
+                    nome TEXT NOT NULL,
+                    especialidade TEXT,
+                    data TEXT NOT NULL,
+                    horario TEXT NOT NULL,
+                    medico TEXT,
+                    medico_id INTEGER NULL,
+                    user_id INTEGER NULL,
+                    arquivado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    data_consulta TEXT NULL
+                )""",
+            ):
+                cursor.execute(ddl)
+            # Arquivos criados antes da coluna `data_consulta` (aaaa-mm-dd, comparável como texto)
+            for tabela in ('agendamentos', 'agendamentos_historico'):
+                self._executar(cursor, f"SELECT 1 FROM pragma_table_info('{tabela}') WHERE name = 'data_consulta'")
+                if cursor.fetchone() is None:
+                    cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN data_consulta TEXT NULL")
+                cursor.execute(f"UPDATE {tabela} SET data_consulta = data_iso(data) WHERE data_consulta IS NULL")
+            for ddl in (
+                "CREATE INDEX IF NOT EXISTS idx_disponibilidade_medico ON medico_disponibilidade (medico_id, dia_da_semana)",
+                "CREATE INDEX IF NOT EXISTS idx_agendamentos_medico ON agendamentos (medico_id, data, horario)",
+                "CREATE INDEX IF NOT EXISTS idx_agendamentos_data ON agendamentos (data)",
+                "CREATE INDEX IF NOT EXISTS idx_agendamentos_user ON agendamentos (user_id)",
+                "CREATE INDEX IF NOT EXISTS idx_agendamentos_data_consulta ON agendamentos (data_consulta)",
+                "CREATE INDEX IF NOT EXISTS idx_eventos_criado_em ON agendamentos_eventos (criado_em)",
+                "CREATE INDEX IF NOT EXISTS idx_historico_user ON agendamentos_historico (user_id)",
+                "CREATE INDEX IF NOT EXISTS idx_historico_usuario_data ON agendamentos_historico (user_id, data_consulta)",
+            ):
+                cursor.execute(ddl)
+            self._semear_especialidades(cursor)
+
+        # Arquivos antigos importados do MySQL podem trazer médicos só em texto livre
+        self._migrar_medicos()
+        self._associar_medicos_antigos()
+
+
+def obter_repositorio(config_mysql=None):
+    """Cria o repositório do backend configurado em CLINICA_BACKEND (mysql ou sqlite)."""
+    backend = os.getenv('CLINICA_BACKEND', 'mysql').lower()
+    if backend == 'sqlite':
+        return RepositorioSQLite(os.getenv('SQLITE_PATH', 'clinica.db'), max_leitores=int(os.getenv('SQLITE_LEITORES', '4')))
+    if backend == 'mysql':
+        return RepositorioMySQL(config_mysql)
+    raise ValueError(f"CLINICA_BACKEND inválido: {backend}. Use 'mysql' ou 'sqlite'.")
@@ -0,0 +1,62 @@
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repositorio import DIAS_DA_SEMANA, ErroDeBanco, RepositorioMySQL, RepositorioSQLite
+
+# Ordem de remoção respeitando a chave estrangeira medicos -> especialidades
+TABELAS = ('agendamentos_eventos', 'agendamentos_historico', 'agendamentos',
+           'medico_disponibilidade', 'medicos', 'especialidades')
+
+
+def data_em(dias):
+    """Data daqui a `dias` dias no formato gravado pelo sistema (dd/mm/aaaa)."""
+    return (date.today() + timedelta(days=dias)).strftime('%d/%m/%Y')
+
+
+def _config_mysql():
+    # Banco exclusivo para os testes: as tabelas são apagadas a cada teste
+    if not os.getenv('TESTE_DB_DATABASE'):
+        pytest.skip('Defina TESTE_DB_DATABASE (e TESTE_DB_HOST/USER/PASSWORD) para testar o backend MySQL.')
+    pytest.importorskip('mysql.connector')
+    return {
+        'host': os.getenv('TESTE_DB_HOST', 'localhost'),
+        'user': os.getenv('TESTE_DB_USER', 'root'),
+        'password': os.getenv('TESTE_DB_PASSWORD'),
+        'database': os.getenv('TESTE_DB_DATABASE')
+    }
+
+
+def _apagar_tabelas(repositorio):
+    with repositorio._transacao() as cursor:
+        for tabela in TABELAS:
+            cursor.execute(f"DROP TABLE IF EXISTS {tabela}")
+
+
+@pytest.fixture(params=['sqlite', 'mysql'])
+def repositorio(request, tmp_path):
+    """Repositório vazio, com as tabelas criadas, em cada um dos backends."""
+    if request.param == 'sqlite':
+        repo = RepositorioSQLite(str(tmp_path / 'clinica.db'))
+    else:
+        repo = RepositorioMySQL(_config_mysql(), replicas=[])
+        try:
+            _apagar_tabelas(repo)
+        except ErroDeBanco as err:
+            pytest.skip(f'MySQL de teste indisponível: {err}')
+    repo.criar_tabelas()
+    yield repo
+    if request.param == 'sqlite':
+        repo.fechar()
+
+
+@pytest.fixture
+def medico_id(repositorio):
+    """Médico de Cardiologia que atende todos os dias, das 08:00 às 18:00."""
+    for dia in DIAS_DA_SEMANA.values():
+        medico = repositorio.adicionar_medico('Dra. Júlia Souza', dia, '08:00', '18:00', 'Cardiologia')
+    return medico
@@ -0,0 +1,209 @@
+import pytest
+
+from banco import RoteadorDeConexoes, replicas_do_ambiente
+from conftest import data_em
+from repositorio import DIAS_DA_SEMANA, RepositorioSQLite
+
+PRIMARIO = {'host': 'primario', 'user': 'root', 'password': 'x', 'database': 'clinica_bot'}
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+class Conexao(str):
+    """Conexão falsa: é o próprio host, e registra se foi fechada."""
+    fechada = False
+
+    def close(self):
+        self.fechada = True
+
+
+class Servidores:
+    """`conectar` falso: devolve o host como "conexão" e falha nos hosts fora do ar."""
+
+    def __init__(self):
+        self.fora_do_ar = set()
+        self.conexoes = []
+        self.atrasos = {}
+        self.medicoes = []
+
+    def __call__(self, **config):
+        self.conexoes.append(config['host'])
+        if config['host'] in self.fora_do_ar:
+            raise ConnectionError(f"{config['host']} recusou a conexão")
+        return Conexao(config['host'])
+
+    def medir_atraso(self, conexao):
+        """Imita o Seconds_Behind_Source: None é replicação parada."""
+        self.medicoes.append(str(conexao))
+        return self.atrasos.get(conexao, 0)
+
+
+def roteador(servidores, relogio, replicas=('replica1', 'replica2'), atraso_maximo=None):
+    return RoteadorDeConexoes(PRIMARIO, [dict(PRIMARIO, host=host) for host in replicas],
+                              conectar=servidores, tempo_de_quarentena=30, atraso_maximo=atraso_maximo,
+                              medir_atraso=servidores.medir_atraso, intervalo_de_verificacao=5, relogio=relogio)
+
+
+def test_replicas_do_ambiente(monkeypatch):
+    monkeypatch.setenv('DB_REPLICAS', 'replica1, replica2:3307,')
+    replicas = replicas_do_ambiente(PRIMARIO)
+    assert [(r['host'], r.get('port')) for r in replicas] == [('replica1', None), ('replica2', 3307)]
+    assert replicas[1]['database'] == 'clinica_bot'
+    monkeypatch.delenv('DB_REPLICAS')
+    assert replicas_do_ambiente(PRIMARIO) == []
+
+
+def test_escritas_vao_ao_primario():
+    servidores = Servidores()
+    assert roteador(servidores, Relogio()).escrita() == 'primario'
+
+
+def test_leituras_em_rodizio():
+    servidores = Servidores()
+    rotas = roteador(servidores, Relogio())
+    assert [rotas.leitura() for _ in range(4)] == ['replica1', 'replica2', 'replica1', 'replica2']
+
+
+def test_exigir_primario():
+    servidores = Servidores()
+    rotas = roteador(servidores, Relogio())
+    assert rotas.leitura(exigir_primario=True) == 'primario'
+    assert servidores.conexoes == ['primario']
+
+
+def test_sem_replicas_le_do_primario():
+    servidores = Servidores()
+    assert roteador(servidores, Relogio(), replicas=()).leitura() == 'primario'
+
+
+def test_quarentena_e_recuperacao():
+    servidores, relogio = Servidores(), Relogio()
+    rotas = roteador(servidores, relogio)
+    servidores.fora_do_ar.add('replica1')
+
+    assert [rotas.leitura() for _ in range(3)] == ['replica2'] * 3
+    assert rotas.replicas_saudaveis() == ['replica2']
+    # Em quarentena, a réplica nem é tentada
+    assert servidores.conexoes.count('replica1') == 1
+
+    servidores.fora_do_ar.clear()
+    relogio.agora = 29.9
+    assert 'replica1' not in {rotas.leitura() for _ in range(2)}
+    relogio.agora = 30
+    assert {rotas.leitura() for _ in range(2)} == {'replica1', 'replica2'}
+    assert rotas.replicas_saudaveis() == ['replica1', 'replica2']
+
+
+def test_todas_as_replicas_fora_usa_o_primario():
+    servidores, relogio = Servidores(), Relogio()
+    rotas = roteador(servidores, relogio)
+    servidores.fora_do_ar.update({'replica1', 'replica2'})
+    assert rotas.leitura() == 'primario'
+    assert rotas.replicas_saudaveis() == []
+    assert rotas.leitura() == 'primario'
+    assert servidores.conexoes == ['replica1', 'replica2', 'primario', 'primario']
+
+
+def test_replica_atrasada_ou_parada_vai_para_a_quarentena():
+    servidores, relogio = Servidores(), Relogio()
+    rotas = roteador(servidores, relogio, replicas=('replica1', 'replica2', 'replica3'), atraso_maximo=5)
+    servidores.atrasos = {'replica1': 6, 'replica2': None, 'replica3': 5}
+
+    conexoes = [rotas.leitura() for _ in range(3)]
+    assert conexoes == ['replica3'] * 3
+    assert rotas.replicas_saudaveis() == ['replica3']
+
+    # Réplica em dia: o atraso é medido de novo só depois do intervalo
+    assert servidores.medicoes == ['replica1', 'replica2', 'replica3']
+    relogio.agora = 5
+    rotas.leitura()
+    assert servidores.medicoes.count('replica3') == 2
+
+    # A réplica que alcançou o primário volta depois da quarentena
+    servidores.atrasos = {}
+    relogio.agora = 30
+    assert {rotas.leitura() for _ in range(3)} == {'replica1', 'replica2', 'replica3'}
+
+
+def test_replica_descartada_tem_a_conexao_fechada():
+    servidores, relogio = Servidores(), Relogio()
+    descartadas = []
+    conectar = servidores.__call__
+
+    def conectar_e_guardar(**config):
+        conexao = conectar(**config)
+        descartadas.append(conexao)
+        return conexao
+
+    rotas = RoteadorDeConexoes(PRIMARIO, [dict(PRIMARIO, host='replica1')], conectar=conectar_e_guardar,
+                               atraso_maximo=5, medir_atraso=lambda conexao: 60, relogio=relogio)
+    assert rotas.leitura() == 'primario'
+    assert [(str(c), c.fechada) for c in descartadas] == [('replica1', True), ('primario', False)]
+
+
+def test_sem_atraso_maximo_nao_mede():
+    servidores = Servidores()
+    servidores.atrasos = {'replica1': 3600}
+    rotas = roteador(servidores, Relogio())
+    assert rotas.leitura() == 'replica1'
+    assert servidores.medicoes == []
+
+
+def test_primario_fora_do_ar_propaga_o_erro():
+    servidores = Servidores()
+    servidores.fora_do_ar.add('primario')
+    with pytest.raises(ConnectionError):
+        roteador(servidores, Relogio()).escrita()
+
+
+# --- Para onde cada operação do repositório vai ---
+class RepositorioRegistrado(RepositorioSQLite):
+    """SQLite que anota se cada conexão pedida foi de escrita, leitura no primário ou leitura em réplica."""
+
+    def __init__(self, caminho):
+        super().__init__(caminho)
+        self.pedidos = []
+
+    def _conectar_escrita(self):
+        self.pedidos.append('escrita')
+        return super()._conectar_escrita()
+
+    def _conectar_leitura(self, exigir_primario):
+        self.pedidos.append('primario' if exigir_primario else 'replica')
+        return super()._conectar_leitura(exigir_primario)
+
+
+@pytest.fixture
+def registrado(tmp_path):
+    repositorio = RepositorioRegistrado(str(tmp_path / 'clinica.db'))
+    repositorio.criar_tabelas()
+    for dia in DIAS_DA_SEMANA.values():
+        medico_id = repositorio.adicionar_medico('Dr. Carlos', dia, '08:00', '18:00')
+    repositorio.criar_agendamento({'nome': 'Ana Lima', 'especialidade': 'Cardiologia', 'data': data_em(-2),
+                                   'horario': '09:00', 'medico': 'Dr. Carlos', 'medico_id': medico_id, 'user_id': 42})
+    repositorio.pedidos.clear()
+    yield repositorio
+    repositorio.fechar()
+
+
+def test_arquivamento_so_usa_o_primario(registrado):
+    assert registrado.arquivar_passados() == 1
+    assert set(registrado.pedidos) == {'escrita'}
+
+
+def test_lembretes_e_historico_leem_das_replicas(registrado):
+    registrado.consultas_para_lembrete(data_em(1))
+    registrado.buscar_historico(user_id=42)
+    assert registrado.pedidos == ['replica', 'replica']
+
+
+def test_validacoes_e_eventos_leem_do_primario(registrado):
+    registrado.verificar_disponibilidade(1, data_em(1), '09:00')
+    registrado.ler_eventos(0)
+    assert registrado.pedidos == ['primario', 'primario']
@@ -0,0 +1,191 @@
+from eventos import FeedDeAgendamentos, LeitorDeEventos, formatar_sse
+
+
+def evento(id, tipo='insert'):
+    return {'id': id, 'tipo': tipo, 'agendamento_id': id, 'dados': {'nome': f'Paciente {id}'}}
+
+
+class TabelaDeEventos:
+    """Imita `ler_eventos` sobre os eventos já commitados, em qualquer ordem de commit."""
+
+    def __init__(self):
+        self.commitados = []
+
+    def commit(self, *ids):
+        self.commitados.extend(evento(i) for i in ids)
+
+    def ler_eventos(self, ultimo_id, limite=500):
+        eventos = sorted(self.commitados, key=lambda e: e['id'])
+        if ultimo_id == 0:
+            return eventos[-limite:]
+        return [e for e in eventos if e['id'] > ultimo_id][:limite]
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+def recebidos(assinante):
+    ids = []
+    while True:
+        item = assinante.proximo(timeout=0)
+        if item is None:
+            return ids
+        ids.append(item['id'] if item['tipo'] != 'reset' else ('reset', item['id']))
+
+
+def test_formatar_sse():
+    texto = formatar_sse(evento(7, 'update'))
+    assert texto.startswith('id: 7\nevent: update\ndata: {')
+    assert texto.endswith('\n\n')
+
+
+def test_assinante_recebe_so_o_que_chega_depois():
+    feed = FeedDeAgendamentos()
+    feed.carregar([evento(1), evento(2)])
+    assinante = feed.assinar()
+    feed.publicar(evento(3))
+    feed.publicar(evento(3))
+    assert recebidos(assinante) == [3]
+
+
+def test_retomada_pelo_last_event_id():
+    feed = FeedDeAgendamentos()
+    feed.carregar([evento(i) for i in range(1, 6)])
+    assinante = feed.assinar(3)
+    feed.publicar(evento(6))
+    assert recebidos(assinante) == [4, 5, 6]
+
+
+def test_retomada_apos_reinicio_espera_a_primeira_leitura():
+    # Processo recém-iniciado: o cliente reconecta antes de o leitor ler a tabela
+    feed = FeedDeAgendamentos()
+    retomada = feed.assinar(12)
+    novo = feed.assinar()
+    assert recebidos(retomada) == []
+
+    feed.carregar([evento(i) for i in range(1, 15)])
+    feed.publicar(evento(15))
+    assert recebidos(retomada) == [13, 14, 15]
+    # Quem conectou sem Last-Event-ID não recebe o histórico carregado
+    assert recebidos(novo) == [15]
+
+
+def test_cliente_muito_atrasado_recebe_reset():
+    feed = FeedDeAgendamentos(tamanho_buffer=3)
+    antes = feed.assinar(2)
+    feed.carregar([evento(i) for i in range(1, 11)])
+    assert recebidos(antes) == [('reset', 10)]
+    depois = feed.assinar(4)
+    assert recebidos(depois) == [('reset', 10)]
+    feed.publicar(evento(11))
+    assert recebidos(depois) == [11]
+
+
+def test_eventos_ja_recebidos_nao_sao_reenviados():
+    feed = FeedDeAgendamentos()
+    feed.carregar([evento(1)])
+    # Cliente à frente do feed (ex.: o leitor deste processo ainda não viu o evento 3)
+    assinante = feed.assinar(3)
+    feed.publicar(evento(2))
+    feed.publicar(evento(3))
+    feed.publicar(evento(4))
+    assert recebidos(assinante) == [4]
+
+
+def test_cancelar_antes_da_primeira_leitura():
+    feed = FeedDeAgendamentos()
+    assinante = feed.assinar(5)
+    feed.cancelar(assinante)
+    feed.carregar([evento(i) for i in range(1, 10)])
+    assert recebidos(assinante) == []
+
+
+def test_fila_transbordada_encerra_o_stream():
+    feed = FeedDeAgendamentos(tamanho_fila_cliente=2)
+    feed.carregar([])
+    assinante = feed.assinar()
+    for i in range(1, 5):
+        feed.publicar(evento(i))
+    assert not assinante.encerrado()
+    assert recebidos(assinante) == [1, 2]
+    assert assinante.encerrado()
+
+
+def leitor_carregado(tabela, relogio, limite=500):
+    feed = FeedDeAgendamentos()
+    leitor = LeitorDeEventos(feed, tabela, limite=limite, espera_lacuna=5, relogio=relogio)
+    leitor.passo()
+    return feed, leitor
+
+
+def test_primeira_leitura_so_carrega_o_buffer():
+    tabela = TabelaDeEventos()
+    tabela.commit(*range(1, 15))
+    feed = FeedDeAgendamentos()
+    assinante = feed.assinar()
+    LeitorDeEventos(feed, tabela).passo()
+    assert feed.carregado and feed.ultimo_id == 14
+    assert recebidos(assinante) == []
+
+
+def test_commit_fora_de_ordem_nao_perde_evento():
+    tabela, relogio = TabelaDeEventos(), Relogio()
+    tabela.commit(9)
+    feed, leitor = leitor_carregado(tabela, relogio)
+    assinante = feed.assinar()
+
+    # O bot pegou o id 10, o painel pegou o 11 e fez commit primeiro
+    tabela.commit(11)
+    leitor.passo()
+    assert recebidos(assinante) == []
+    relogio.agora = 1
+    tabela.commit(10)
+    leitor.passo()
+    assert recebidos(assinante) == [10, 11]
+
+
+def test_lacuna_de_transacao_desfeita_expira():
+    tabela, relogio = TabelaDeEventos(), Relogio()
+    tabela.commit(9)
+    feed, leitor = leitor_carregado(tabela, relogio)
+    assinante = feed.assinar()
+
+    tabela.commit(11, 12)
+    leitor.passo()
+    relogio.agora = 4.9
+    leitor.passo()
+    assert recebidos(assinante) == []
+    relogio.agora = 5
+    leitor.passo()
+    assert recebidos(assinante) == [11, 12]
+
+    # Uma nova lacuna tem o próprio prazo
+    tabela.commit(14)
+    relogio.agora = 6
+    leitor.passo()
+    assert recebidos(assinante) == []
+
+
+def test_leitura_em_paginas():
+    tabela, relogio = TabelaDeEventos(), Relogio()
+    tabela.commit(1)
+    feed, leitor = leitor_carregado(tabela, relogio, limite=2)
+    assinante = feed.assinar()
+    tabela.commit(2, 3, 4)
+    assert leitor.passo() is True
+    assert leitor.passo() is False
+    assert recebidos(assinante) == [2, 3, 4]
+
+
+def test_tabela_vazia_aceita_o_primeiro_id():
+    tabela, relogio = TabelaDeEventos(), Relogio()
+    feed, leitor = leitor_carregado(tabela, relogio)
+    assinante = feed.assinar()
+    tabela.commit(40)
+    leitor.passo()
+    assert recebidos(assinante) == [40]
@@ -0,0 +1,170 @@
+import asyncio
+from types import SimpleNamespace
+
+from limitador import ControleDeFluxo, TokenBucket
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+class Dormir:
+    """Registra as esperas sem dormir de verdade."""
+
+    def __init__(self):
+        self.esperas = []
+
+    async def __call__(self, segundos):
+        self.esperas.append(segundos)
+        await asyncio.sleep(0)
+
+
+def controle(relogio, dormir=None, **limites):
+    return ControleDeFluxo(relogio=relogio, dormir=dormir or Dormir(), **limites)
+
+
+async def nada():
+    pass
+
+
+def rajada(controle, mensagens, **kwargs):
+    """Dispara as mensagens (user_id, funcao) todas no mesmo instante."""
+    async def disparar():
+        return await asyncio.gather(*(controle.executar(user_id, funcao, **kwargs) for user_id, funcao in mensagens))
+    return asyncio.run(disparar())
+
+
+# --- TokenBucket ---
+def test_bucket_rajada_espera_e_reposicao():
+    relogio = Relogio()
+    bucket = TokenBucket(taxa=2, capacidade=2, relogio=relogio)
+    assert bucket.reservar() == 0
+    assert bucket.reservar() == 0
+    assert bucket.reservar() is None
+    assert bucket.reservar(atraso_maximo=1) == 0.5
+    assert bucket.reservar(atraso_maximo=1) == 1.0
+    assert bucket.reservar(atraso_maximo=1) is None
+    relogio.agora = 10
+    assert bucket.cheio()
+    assert bucket.fichas == 2
+
+
+# --- ControleDeFluxo ---
+def test_descarta_por_usuario_sem_afetar_os_outros():
+    relogio = Relogio()
+    fluxo = controle(relogio, taxa_usuario=1, rajada_usuario=2, atraso_maximo=0)
+    resultados = rajada(fluxo, [(1, nada)] * 5 + [(2, nada)])
+    assert resultados == [True, True, False, False, False, True]
+    assert fluxo.descartadas_usuario == 3
+    assert fluxo.processadas == 3
+    # Depois de 1s o usuário 1 ganhou uma ficha de volta
+    relogio.agora = 1
+    assert rajada(fluxo, [(1, nada)] * 2) == [True, False]
+
+
+def test_descarta_pelo_limite_global_e_devolve_a_ficha_do_usuario():
+    relogio = Relogio()
+    fluxo = controle(relogio, taxa_usuario=1, rajada_usuario=1, taxa_global=1, rajada_global=3, atraso_maximo=0)
+    resultados = rajada(fluxo, [(user_id, nada) for user_id in range(5)])
+    assert resultados == [True, True, True, False, False]
+    assert fluxo.descartadas_global == 2
+    assert fluxo.descartadas_usuario == 0
+    # Quem foi barrado no global não gastou a própria ficha
+    relogio.agora = 3
+    assert rajada(fluxo, [(3, nada), (4, nada)]) == [True, True]
+
+
+def test_atrasa_dentro_do_atraso_maximo():
+    relogio, dormir = Relogio(), Dormir()
+    fluxo = controle(relogio, dormir, taxa_usuario=1, rajada_usuario=1, atraso_maximo=2)
+    resultados = rajada(fluxo, [(1, nada)] * 4)
+    assert resultados == [True, True, True, False]
+    assert dormir.esperas == [1.0, 2.0]
+    assert fluxo.atrasadas == 2
+    assert fluxo.descartadas_usuario == 1
+
+
+def test_fila_cheia_descarta_carga():
+    relogio = Relogio()
+    fluxo = controle(relogio, max_fila=2, max_concorrentes=1)
+    liberar = asyncio.Event()
+
+    async def lenta():
+        await liberar.wait()
+
+    async def cenario():
+        tarefas = [asyncio.create_task(fluxo.executar(user_id, lenta)) for user_id in (1, 2)]
+        await asyncio.sleep(0)
+        assert fluxo.pendentes == 2
+        assert await fluxo.executar(3, nada) is False
+        liberar.set()
+        return await asyncio.gather(*tarefas)
+
+    assert asyncio.run(cenario()) == [True, True]
+    assert fluxo.descartadas_fila == 1
+    assert fluxo.pendentes == 0
+    assert fluxo.estatisticas()['processadas'] == 2
+
+
+def test_aviso_de_descarte_no_maximo_um_por_intervalo():
+    relogio = Relogio()
+    fluxo = controle(relogio, taxa_usuario=0.01, rajada_usuario=1, atraso_maximo=0, intervalo_aviso=10)
+    avisos = []
+
+    async def avisar():
+        avisos.append(relogio.agora)
+
+    rajada(fluxo, [(1, nada)] * 5, ao_descartar=avisar)
+    assert avisos == [0.0]
+    relogio.agora = 9.9
+    rajada(fluxo, [(1, nada)], ao_descartar=avisar)
+    relogio.agora = 10
+    rajada(fluxo, [(1, nada)], ao_descartar=avisar)
+    assert avisos == [0.0, 10]
+
+
+def test_mantem_a_ordem_das_mensagens_de_um_chat():
+    relogio = Relogio()
+    # Esperas reais, mas em milissegundos, para as tarefas disputarem de verdade
+    fluxo = controle(relogio, lambda segundos: asyncio.sleep(segundos / 1000),
+                     taxa_usuario=100, rajada_usuario=2, atraso_maximo=1)
+    processadas = []
+
+    def mensagem(user_id, n):
+        async def funcao():
+            await asyncio.sleep(0.001 if n == 0 else 0)
+            processadas.append((user_id, n))
+        return user_id, funcao
+
+    mensagens = [mensagem(user_id, n) for n in range(6) for user_id in (1, 2)]
+    assert all(rajada(fluxo, mensagens))
+    for user_id in (1, 2):
+        assert [n for u, n in processadas if u == user_id] == list(range(6))
+
+
+def test_proteger_handler_do_telegram():
+    relogio = Relogio()
+    fluxo = controle(relogio, taxa_usuario=0.01, rajada_usuario=1, atraso_maximo=0)
+    respostas, chamadas = [], []
+
+    async def reply_text(texto):
+        respostas.append(texto)
+
+    async def handler(update, context):
+        chamadas.append(context)
+
+    protegido = fluxo.proteger(handler, 'Muitas mensagens, aguarde.')
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=7), message=SimpleNamespace(reply_text=reply_text))
+
+    async def cenario():
+        await protegido(update, 'ctx1')
+        await protegido(update, 'ctx2')
+
+    asyncio.run(cenario())
+    assert protegido.__name__ == 'handler'
+    assert chamadas == ['ctx1']
+    assert respostas == ['Muitas mensagens, aguarde.']
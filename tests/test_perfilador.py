@@ -0,0 +1,88 @@
+import asyncio
+import os
+
+import pytest
+
+from perfilador import Perfilador, como_booleano
+
+
+@pytest.mark.parametrize('valor, esperado', [
+    (True, True), (False, False), (1, True), (0, False),
+    ('1', True), ('true', True), ('Sim', True), ('false', False), ('0', False), ('', False), ('nao', False),
+])
+def test_como_booleano(valor, esperado):
+    assert como_booleano(valor) is esperado
+
+
+def test_configurar_nao_liga_com_texto_falso():
+    perfilador = Perfilador(ativo=True)
+    perfilador.configurar(ativo='false')
+    assert perfilador.ativo is False
+    perfilador.configurar(ativo='1')
+    assert perfilador.ativo is True
+    perfilador.configurar(ativo='0')
+    assert perfilador.ativo is False
+    # Sem `ativo`, o estado não muda
+    perfilador.configurar(amostra=0.5)
+    assert perfilador.ativo is False and perfilador.amostra == 0.5
+
+
+@pytest.mark.parametrize('valor, esperado', [('1', True), ('true', True), ('SIM', True), ('0', False), ('false', False)])
+def test_do_ambiente_aceita_os_mesmos_valores(monkeypatch, tmp_path, valor, esperado):
+    monkeypatch.setenv('PERFIL_ATIVO', valor)
+    monkeypatch.setenv('PERFIL_DIR', str(tmp_path))
+    assert Perfilador.do_ambiente().ativo is esperado
+
+
+def test_do_ambiente_desligado_por_padrao(monkeypatch, tmp_path):
+    monkeypatch.delenv('PERFIL_ATIVO', raising=False)
+    monkeypatch.setenv('PERFIL_DIR', str(tmp_path))
+    assert Perfilador.do_ambiente().ativo is False
+
+
+def test_configurar_valida_a_amostra():
+    with pytest.raises(ValueError):
+        Perfilador().configurar(amostra=1.5)
+
+
+def test_perfila_funcoes_sincronas_e_assincronas(tmp_path):
+    perfilador = Perfilador(ativo=True, amostra=1, diretorio=str(tmp_path))
+
+    @perfilador.perfilar('rota')
+    def rota():
+        return sum(range(1000))
+
+    @perfilador.perfilar('handler')
+    async def handler():
+        return 'ok'
+
+    assert rota() == sum(range(1000))
+    assert asyncio.run(handler()) == 'ok'
+    top = perfilador.top(5)
+    assert set(top['chamadas_perfiladas']) == {'rota', 'handler'}
+    assert perfilador.estado()['arquivos'] == 2
+
+
+def test_desligado_nao_grava_nada(tmp_path):
+    perfilador = Perfilador(ativo=False, amostra=1, diretorio=str(tmp_path))
+    perfilador.perfilar('rota')(lambda: None)()
+    assert os.listdir(tmp_path) == []
+
+
+def test_rotacao_conta_os_arquivos_de_todos_os_processos(tmp_path):
+    # Perfis antigos de outro processo (ex.: o bot) no mesmo PERFIL_DIR
+    for i in range(3):
+        caminho = tmp_path / f'outro_processo_{i}.prof'
+        caminho.write_bytes(b'')
+        os.utime(caminho, (i, i))
+
+    api = Perfilador(ativo=True, amostra=1, diretorio=str(tmp_path), max_arquivos=4)
+    painel = Perfilador(ativo=True, amostra=1, diretorio=str(tmp_path), max_arquivos=4)
+    for perfilador, nome in ((api, 'api.rota'), (painel, 'painel.rota'), (api, 'api.rota')):
+        perfilador.perfilar(nome)(lambda: None)()
+
+    arquivos = sorted(os.listdir(tmp_path))
+    assert len(arquivos) == 4
+    # Os mais antigos saíram primeiro, mesmo sendo de outro processo
+    assert [a for a in arquivos if a.startswith('outro_processo')] == ['outro_processo_2.prof']
+    assert api.estado()['arquivos'] == painel.estado()['arquivos'] == 4
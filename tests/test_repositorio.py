@@ -0,0 +1,457 @@
+"""Conformidade dos backends: os mesmos testes rodam no SQLite e no MySQL."""
+import sqlite3
+import threading
+
+import pytest
+
+from conftest import data_em
+from repositorio import DIAS_DA_SEMANA, HorarioIndisponivel, RepositorioSQLite, data_iso, dia_da_semana
+
+
+def agendar(repositorio, medico_id, data, horario, nome='Ana Lima', user_id=None, medico='Dra. Júlia Souza'):
+    return repositorio.criar_agendamento({
+        'nome': nome, 'especialidade': 'Cardiologia', 'data': data, 'horario': horario,
+        'medico': medico, 'medico_id': medico_id, 'user_id': user_id
+    })
+
+
+# --- Agendamentos e busca ---
+def test_criar_tabelas_e_idempotente(repositorio):
+    repositorio.criar_tabelas()
+    especialidades, medicos = repositorio.carregar_catalogo()
+    assert [e['nome'] for e in especialidades] == ['Cardiologia', 'Dermatologia', 'Ginecologia', 'Pediatria']
+    assert medicos == []
+
+
+def test_criar_e_buscar_agendamento(repositorio, medico_id):
+    agendamento_id = agendar(repositorio, medico_id, data_em(3), '09:00', user_id=42)
+    agendamento = repositorio.buscar_agendamento(agendamento_id)
+    assert agendamento['nome'] == 'Ana Lima'
+    assert agendamento['medico'] == 'Dra. Júlia Souza'
+    assert agendamento['medico_id'] == medico_id
+    assert repositorio.buscar_agendamento(agendamento_id + 1000) is None
+    assert [c['id'] for c in repositorio.consultas_do_usuario(42)] == [agendamento_id]
+    assert repositorio.nome_do_usuario(42) == 'Ana Lima'
+    assert repositorio.nome_do_usuario(43) is None
+
+
+def test_listar_ordena_por_data_e_horario(repositorio, medico_id):
+    tarde = agendar(repositorio, medico_id, data_em(2), '15:00')
+    depois = agendar(repositorio, medico_id, data_em(10), '08:00')
+    cedo = agendar(repositorio, medico_id, data_em(2), '09:00')
+    assert [a['id'] for a in repositorio.listar_agendamentos()] == [cedo, tarde, depois]
+
+
+def test_busca_por_paciente_especialidade_ou_medico(repositorio, medico_id):
+    ana = agendar(repositorio, medico_id, data_em(2), '09:00', nome='Ana Lima')
+    bruno = agendar(repositorio, medico_id, data_em(2), '10:00', nome='Bruno Reis')
+    assert [a['id'] for a in repositorio.listar_agendamentos('Bruno')] == [bruno]
+    assert [a['id'] for a in repositorio.listar_agendamentos('Cardio')] == [ana, bruno]
+    assert [a['id'] for a in repositorio.listar_agendamentos('Júlia')] == [ana, bruno]
+    assert repositorio.listar_agendamentos('Pediatria') == []
+
+
+def test_atualizar_agendamento(repositorio, medico_id):
+    agendamento_id = agendar(repositorio, medico_id, data_em(2), '09:00')
+    dados = {'nome': 'Ana Souza', 'especialidade': 'Cardiologia', 'medico': 'Dra. Júlia Souza',
+             'medico_id': medico_id, 'data': data_em(4), 'horario': '11:00'}
+    assert repositorio.atualizar_agendamento(agendamento_id, dados)
+    atualizado = repositorio.buscar_agendamento(agendamento_id)
+    assert (atualizado['nome'], atualizado['data'], atualizado['horario']) == ('Ana Souza', data_em(4), '11:00')
+    assert not repositorio.atualizar_agendamento(agendamento_id + 1000, dados)
+
+
+def test_excluir_agendamento_respeita_o_usuario(repositorio, medico_id):
+    agendamento_id = agendar(repositorio, medico_id, data_em(2), '09:00', user_id=42)
+    assert repositorio.excluir_agendamento(agendamento_id, user_id=7) is None
+    excluido = repositorio.excluir_agendamento(agendamento_id, user_id=42)
+    assert excluido['nome'] == 'Ana Lima'
+    assert repositorio.buscar_agendamento(agendamento_id) is None
+    assert repositorio.excluir_agendamento(agendamento_id) is None
+
+
+# --- Disponibilidade ---
+def test_verificar_disponibilidade(repositorio, medico_id):
+    data = data_em(2)
+    assert repositorio.verificar_disponibilidade(medico_id, data, '09:00') is None
+    assert repositorio.verificar_disponibilidade(medico_id, data, '19:00') == 'indisponivel'
+    agendamento_id = agendar(repositorio, medico_id, data, '09:00')
+    assert repositorio.verificar_disponibilidade(medico_id, data, '09:00') == 'ocupado'
+    # O próprio agendamento não conflita com ele mesmo (edição)
+    assert repositorio.verificar_disponibilidade(medico_id, data, '09:00', ignorar_id=agendamento_id) is None
+
+
+def test_criar_agendamento_valida_o_horario_ao_gravar(repositorio, medico_id):
+    data = data_em(2)
+    agendar(repositorio, medico_id, data, '09:00')
+    with pytest.raises(HorarioIndisponivel) as erro:
+        agendar(repositorio, medico_id, data, '09:00', nome='Bruno Reis')
+    assert erro.value.motivo == 'ocupado'
+    with pytest.raises(HorarioIndisponivel) as erro:
+        agendar(repositorio, medico_id, data, '19:00')
+    assert erro.value.motivo == 'indisponivel'
+    # A recusa não grava nada, nem evento
+    assert len(repositorio.listar_agendamentos()) == 1
+    assert len(repositorio.ler_eventos(0)) == 1
+
+
+def test_disponibilidade_segue_o_dia_da_semana(repositorio):
+    medico_id = repositorio.adicionar_medico('Dr. Carlos', dia_da_semana(data_em(1)), '08:00', '12:00')
+    assert repositorio.verificar_disponibilidade(medico_id, data_em(1), '10:00') is None
+    assert repositorio.verificar_disponibilidade(medico_id, data_em(2), '10:00') == 'indisponivel'
+    assert [d['medico'] for d in repositorio.listar_disponibilidades()] == ['Dr. Carlos']
+
+
+# --- Operações em lote ---
+def test_excluir_em_lote(repositorio, medico_id):
+    a = agendar(repositorio, medico_id, data_em(2), '09:00')
+    b = agendar(repositorio, medico_id, data_em(2), '10:00')
+    assert repositorio.excluir_em_lote([a, b, b + 1000]) == {a, b}
+    assert repositorio.listar_agendamentos() == []
+
+
+def test_excluir_agendamentos_de_usuarios(repositorio, medico_id):
+    agendar(repositorio, medico_id, data_em(2), '09:00', user_id=1)
+    agendar(repositorio, medico_id, data_em(2), '10:00', user_id=2)
+    fica = agendar(repositorio, medico_id, data_em(2), '11:00', user_id=3)
+    ultimo = repositorio.ler_eventos(0)[-1]['id']
+    assert repositorio.excluir_agendamentos_de_usuarios([1, 2]) == 2
+    assert [a['id'] for a in repositorio.listar_agendamentos()] == [fica]
+    # Os clientes do feed também precisam saber das exclusões
+    eventos = repositorio.ler_eventos(ultimo)
+    assert [e['tipo'] for e in eventos] == ['delete', 'delete']
+    assert fica not in {e['agendamento_id'] for e in eventos}
+
+
+def test_reagendar_em_lote(repositorio, medico_id):
+    data, nova_data = data_em(2), data_em(5)
+    a = agendar(repositorio, medico_id, data, '09:00')
+    b = agendar(repositorio, medico_id, data, '10:00')
+    c = agendar(repositorio, medico_id, data, '11:00')
+    agendar(repositorio, medico_id, nova_data, '11:00', nome='Fora do lote')
+
+    resultados = repositorio.reagendar_em_lote([a, b, c, c + 1000], nova_data, horarios={str(b): '19:00'})
+    assert [r['status'] for r in resultados] == ['reagendado', 'indisponivel', 'ocupado', 'nao_encontrado']
+    assert repositorio.buscar_agendamento(a)['data'] == nova_data
+    assert repositorio.buscar_agendamento(b)['data'] == data
+    assert repositorio.buscar_agendamento(c)['data'] == data
+
+
+def test_reagendar_em_lote_nao_repete_horario_dentro_do_lote(repositorio, medico_id):
+    data, nova_data = data_em(2), data_em(5)
+    a = agendar(repositorio, medico_id, data, '09:00')
+    b = agendar(repositorio, medico_id, data_em(3), '09:00')
+    resultados = repositorio.reagendar_em_lote([a, b], nova_data)
+    assert [r['status'] for r in resultados] == ['reagendado', 'ocupado']
+
+
+def test_reagendar_em_lote_nao_marca_dois_no_mesmo_horario(repositorio, medico_id):
+    dia, vespera = data_em(5), data_em(4)
+    a = agendar(repositorio, medico_id, dia, '10:00', nome='A')
+    b = agendar(repositorio, medico_id, vespera, '09:00', nome='B')
+    agendar(repositorio, medico_id, dia, '09:00', nome='C, fora do lote')
+
+    # A quer as 09:00 (ocupadas por C) e fica nas 10:00; B não pode ir para as 10:00 de A
+    resultados = repositorio.reagendar_em_lote([a, b], dia, horarios={a: '09:00', b: '10:00'})
+    assert [r['status'] for r in resultados] == ['ocupado', 'ocupado']
+    horarios = [(x['data'], x['horario']) for x in repositorio.listar_agendamentos()]
+    assert len(horarios) == len(set(horarios))
+    assert (repositorio.buscar_agendamento(b)['data'], repositorio.buscar_agendamento(b)['horario']) == (vespera, '09:00')
+
+
+def test_reagendar_em_lote_libera_o_horario_de_quem_saiu(repositorio, medico_id):
+    dia = data_em(5)
+    a = agendar(repositorio, medico_id, dia, '10:00', nome='A')
+    b = agendar(repositorio, medico_id, data_em(4), '09:00', nome='B')
+    # A sai das 10:00 antes de B pedir esse horário; A "reagendado" para onde já está também vale
+    resultados = repositorio.reagendar_em_lote([a, b], dia, horarios={a: '11:00', b: '10:00'})
+    assert [r['status'] for r in resultados] == ['reagendado', 'reagendado']
+    assert repositorio.buscar_agendamento(b)['horario'] == '10:00'
+    assert [r['status'] for r in repositorio.reagendar_em_lote([b], dia)] == ['reagendado']
+
+
+# --- Lembretes ---
+def test_consultas_para_lembrete(repositorio, medico_id):
+    amanha = data_em(1)
+    agendar(repositorio, medico_id, amanha, '09:00', user_id=42)
+    agendar(repositorio, medico_id, data_em(2), '09:00', user_id=43)
+    consultas = repositorio.consultas_para_lembrete(amanha)
+    assert [(c['user_id'], c['horario'], c['medico']) for c in consultas] == [(42, '09:00', 'Dra. Júlia Souza')]
+
+
+# --- Eventos ---
+def test_escritas_gravam_eventos_em_ordem(repositorio, medico_id):
+    a = agendar(repositorio, medico_id, data_em(2), '09:00')
+    b = agendar(repositorio, medico_id, data_em(2), '10:00')
+    repositorio.reagendar_em_lote([a], data_em(3))
+    repositorio.excluir_agendamento(b)
+
+    eventos = repositorio.ler_eventos(0)
+    assert [(e['tipo'], e['agendamento_id']) for e in eventos] == [('insert', a), ('insert', b), ('update', a), ('delete', b)]
+    assert eventos[2]['dados']['data'] == data_em(3)
+    ids = [e['id'] for e in eventos]
+    assert ids == sorted(ids)
+    # Primeira leitura traz só os mais recentes; as seguintes, o que vier depois do id informado
+    assert [e['id'] for e in repositorio.ler_eventos(0, limite=2)] == ids[2:]
+    assert [e['id'] for e in repositorio.ler_eventos(ids[1])] == ids[2:]
+    assert repositorio.ler_eventos(ids[-1]) == []
+
+
+def test_escrita_com_erro_nao_grava_evento(repositorio, medico_id):
+    with pytest.raises(KeyError):
+        repositorio.criar_agendamento({'nome': 'Sem data', 'especialidade': 'Cardiologia'})
+    assert repositorio.ler_eventos(0) == []
+
+
+def test_podar_eventos(repositorio, medico_id):
+    ids = [agendar(repositorio, medico_id, data_em(2), f'{h:02d}:00') for h in range(8, 14)]
+    eventos = [e['id'] for e in repositorio.ler_eventos(0)]
+    # Nada é antigo o bastante ainda
+    assert repositorio.podar_eventos(dias=7, manter=2) == 0
+
+    with repositorio._transacao() as cursor:
+        repositorio._executar(cursor, "UPDATE agendamentos_eventos SET criado_em = %s WHERE id <= %s",
+                              ('2000-01-01 00:00:00', eventos[4]))
+    # Antigos, mas os 2 mais recentes ficam para o buffer do feed
+    assert repositorio.podar_eventos(dias=7, manter=2, lote=2) == 4
+    assert [e['id'] for e in repositorio.ler_eventos(0)] == eventos[4:]
+    assert len(repositorio.listar_agendamentos()) == len(ids)
+
+
+def test_podar_eventos_sem_eventos(repositorio):
+    assert repositorio.podar_eventos() == 0
+
+
+# --- Histórico ---
+def test_arquivar_passados(repositorio, medico_id):
+    antiga = agendar(repositorio, medico_id, data_em(-30), '09:00', user_id=42)
+    ontem = agendar(repositorio, medico_id, data_em(-1), '10:00', user_id=42)
+    hoje = agendar(repositorio, medico_id, data_em(0), '11:00', user_id=42)
+    futura = agendar(repositorio, medico_id, data_em(5), '12:00', user_id=42)
+    ultimo = repositorio.ler_eventos(0)[-1]['id']
+
+    assert repositorio.arquivar_passados(lote=1) == 2
+    # As consultas arquivadas saem também das telas ligadas ao feed
+    eventos = repositorio.ler_eventos(ultimo)
+    assert sorted((e['tipo'], e['agendamento_id']) for e in eventos) == sorted([('delete', antiga), ('delete', ontem)])
+    assert [a['id'] for a in repositorio.listar_agendamentos()] == [hoje, futura]
+    historico = repositorio.buscar_historico(user_id=42)
+    assert [h['id'] for h in historico] == [ontem, antiga]
+    assert historico[0]['medico'] == 'Dra. Júlia Souza'
+    assert repositorio.arquivar_passados() == 0
+
+
+def test_data_consulta_acompanha_a_data(repositorio, medico_id):
+    def data_consulta(agendamento_id):
+        with repositorio._leitura(exigir_primario=True) as cursor:
+            repositorio._executar(cursor, "SELECT data_consulta FROM agendamentos WHERE id = %s", (agendamento_id,))
+            return str(cursor.fetchone()['data_consulta'])
+
+    a = agendar(repositorio, medico_id, data_em(2), '09:00')
+    assert data_consulta(a) == data_iso(data_em(2))
+    dados = dict(repositorio.buscar_agendamento(a), data=data_em(3))
+    repositorio.atualizar_agendamento(a, dados)
+    assert data_consulta(a) == data_iso(data_em(3))
+    repositorio.reagendar_em_lote([a], data_em(4))
+    assert data_consulta(a) == data_iso(data_em(4))
+
+
+def test_buscar_historico_filtra_e_pagina(repositorio, medico_id):
+    for dias, nome in ((-3, 'Ana Lima'), (-2, 'Bruno Reis'), (-1, 'Ana Souza')):
+        agendar(repositorio, medico_id, data_em(dias), '09:00', nome=nome, user_id=1)
+    repositorio.arquivar_passados()
+    assert [h['nome'] for h in repositorio.buscar_historico(termo_busca='Ana')] == ['Ana Souza', 'Ana Lima']
+    assert [h['nome'] for h in repositorio.buscar_historico(limite=1, deslocamento=1)] == ['Bruno Reis']
+    assert repositorio.buscar_historico(user_id=2) == []
+
+
+# --- Catálogo ---
+def test_adicionar_medico_atualiza_o_catalogo(repositorio):
+    antes = repositorio.assinatura_catalogo()
+    carlos = repositorio.adicionar_medico('Dr. Carlos', 'Segunda-feira', '08:00', '12:00', 'Pediatria')
+    assert repositorio.assinatura_catalogo() != antes
+    # Segunda faixa do mesmo médico: reaproveita o cadastro
+    assert repositorio.adicionar_medico('Dr. Carlos', 'Terça-feira', '08:00', '12:00') == carlos
+    especialidades, medicos = repositorio.carregar_catalogo()
+    assert [(m['id'], m['nome'], m['especialidade']) for m in medicos] == [(carlos, 'Dr. Carlos', 'Pediatria')]
+    assert len(repositorio.listar_disponibilidades()) == 2
+
+
+def test_adicionar_medico_reconhece_o_nome_sem_prefixo(repositorio):
+    carlos = repositorio.adicionar_medico('Dr. Carlos', 'Segunda-feira', '08:00', '12:00', 'Pediatria')
+    assert repositorio.adicionar_medico('Carlos', 'Terça-feira', '08:00', '12:00') == carlos
+    assert repositorio.adicionar_medico('dr carlos', 'Quarta-feira', '08:00', '12:00') == carlos
+    assert repositorio.adicionar_medico('Dr. Carlos Lima', 'Quarta-feira', '08:00', '12:00') != carlos
+    _, medicos = repositorio.carregar_catalogo()
+    assert sorted(m['nome'] for m in medicos) == ['Dr. Carlos', 'Dr. Carlos Lima']
+
+
+def test_migracao_associa_medicos_em_texto_livre(repositorio):
+    with repositorio._transacao() as cursor:
+        repositorio._executar(cursor, """
+            INSERT INTO medico_disponibilidade (medico_nome, dia_da_semana, horario_inicio, horario_fim)
+            VALUES (%s, %s, %s, %s)
+        """, ('Dra. Júlia Souza', 'Segunda-feira', '08:00', '12:00'))
+        repositorio._executar(cursor, """
+            INSERT INTO agendamentos (nome, especialidade, data, horario, medico) VALUES (%s, %s, %s, %s, %s)
+        """, ('Ana Lima', 'Cardiologia', data_em(2), '09:00', 'julia'))
+    repositorio.criar_tabelas()
+    _, medicos = repositorio.carregar_catalogo()
+    assert [m['nome'] for m in medicos] == ['Dra. Júlia Souza']
+    assert repositorio.listar_disponibilidades()[0]['medico_id'] == medicos[0]['id']
+    assert repositorio.listar_agendamentos()[0]['medico_id'] == medicos[0]['id']
+
+
+def test_migracao_unifica_formas_do_mesmo_medico(repositorio):
+    # adicionar_medico.py gravava 'Dr. Carlos'; outras telas, só 'Carlos'
+    with repositorio._transacao() as cursor:
+        for nome, dia in (('Dr. Carlos', 'Segunda-feira'), ('Carlos', 'Terça-feira'), ('Dra. Carla', 'Segunda-feira')):
+            repositorio._executar(cursor, """
+                INSERT INTO medico_disponibilidade (medico_nome, dia_da_semana, horario_inicio, horario_fim)
+                VALUES (%s, %s, %s, %s)
+            """, (nome, dia, '08:00', '12:00'))
+        repositorio._executar(cursor, """
+            INSERT INTO agendamentos (nome, especialidade, data, horario, medico) VALUES (%s, %s, %s, %s, %s)
+        """, ('Ana Lima', 'Cardiologia', data_em(2), '09:00', 'Dr Carlos'))
+    repositorio.criar_tabelas()
+
+    _, medicos = repositorio.carregar_catalogo()
+    assert sorted(m['nome'] for m in medicos) == ['Dr. Carlos', 'Dra. Carla']
+    carlos = next(m['id'] for m in medicos if m['nome'] == 'Dr. Carlos')
+    assert [d['dia_da_semana'] for d in repositorio.listar_disponibilidades() if d['medico_id'] == carlos] == \
+        ['Segunda-feira', 'Terça-feira']
+    assert repositorio.listar_agendamentos()[0]['medico_id'] == carlos
+    # Rodar de novo não duplica nada
+    repositorio.criar_tabelas()
+    assert len(repositorio.carregar_catalogo()[1]) == 2
+
+
+def test_migracao_reaproveita_medico_ja_cadastrado(repositorio):
+    carlos = repositorio.adicionar_medico('Dr. Carlos', 'Segunda-feira', '08:00', '12:00')
+    with repositorio._transacao() as cursor:
+        repositorio._executar(cursor, """
+            INSERT INTO medico_disponibilidade (medico_nome, dia_da_semana, horario_inicio, horario_fim)
+            VALUES (%s, %s, %s, %s)
+        """, ('carlos', 'Quarta-feira', '08:00', '12:00'))
+    repositorio.criar_tabelas()
+    assert [m['id'] for m in repositorio.carregar_catalogo()[1]] == [carlos]
+    assert repositorio.verificar_disponibilidade(carlos, '04/02/2032', '10:00') is None
+
+
+# --- Específicos do SQLite ---
+def test_sqlite_usa_wal(tmp_path):
+    repositorio = RepositorioSQLite(str(tmp_path / 'clinica.db'))
+    repositorio.criar_tabelas()
+    with repositorio._leitura() as cursor:
+        cursor.execute("PRAGMA journal_mode")
+        assert cursor.fetchone()['journal_mode'] == 'wal'
+    repositorio.fechar()
+
+
+def test_sqlite_arquivamento_usa_o_indice_de_data(tmp_path):
+    repositorio = RepositorioSQLite(str(tmp_path / 'clinica.db'))
+    repositorio.criar_tabelas()
+    with repositorio._leitura() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN SELECT id FROM agendamentos WHERE data_consulta < date('now', 'localtime') LIMIT 1000")
+        plano = ' '.join(linha['detail'] for linha in cursor.fetchall())
+    assert 'idx_agendamentos_data_consulta' in plano
+    repositorio.fechar()
+
+
+def test_sqlite_migra_arquivo_sem_data_consulta(tmp_path):
+    caminho = str(tmp_path / 'clinica.db')
+    conn = sqlite3.connect(caminho)
+    conn.executescript("""
+        CREATE TABLE agendamentos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, nome TEXT NOT NULL, especialidade TEXT, data TEXT NOT NULL,
+            horario TEXT NOT NULL, medico TEXT, medico_id INTEGER NULL, user_id INTEGER NULL
+        );
+        CREATE TABLE agendamentos_historico (
+            id INTEGER PRIMARY KEY, nome TEXT NOT NULL, especialidade TEXT, data TEXT NOT NULL, horario TEXT NOT NULL,
+            medico TEXT, medico_id INTEGER NULL, user_id INTEGER NULL, arquivado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    conn.execute("INSERT INTO agendamentos (nome, data, horario) VALUES (?, ?, ?)", ('Ana Lima', data_em(-3), '09:00'))
+    conn.execute("INSERT INTO agendamentos (nome, data, horario) VALUES (?, ?, ?)", ('Bruno Reis', data_em(3), '09:00'))
+    conn.commit()
+    conn.close()
+
+    repositorio = RepositorioSQLite(caminho)
+    repositorio.criar_tabelas()
+    assert repositorio.arquivar_passados() == 1
+    assert [h['nome'] for h in repositorio.buscar_historico()] == ['Ana Lima']
+    repositorio.fechar()
+
+
+def test_sqlite_reaproveita_conexoes_entre_threads(tmp_path):
+    repositorio = RepositorioSQLite(str(tmp_path / 'clinica.db'), max_leitores=2)
+    repositorio.criar_tabelas()
+    conexoes = set()
+
+    def requisicao():
+        for _ in range(50):
+            with repositorio._leitura() as cursor:
+                conexoes.add(id(cursor.connection))
+                repositorio._executar(cursor, "SELECT COUNT(*) AS total FROM agendamentos WHERE data = %s", ('01/01/2030',))
+
+    # Uma thread por requisição, como no servidor do Flask
+    threads = [threading.Thread(target=requisicao) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(conexoes) <= 2
+    assert repositorio._leitores_abertos <= 2
+    repositorio.fechar()
+
+
+def test_sqlite_escritas_concorrentes(tmp_path):
+    repositorio = RepositorioSQLite(str(tmp_path / 'clinica.db'))
+    repositorio.criar_tabelas()
+    for dia in DIAS_DA_SEMANA.values():
+        medico_id = repositorio.adicionar_medico('Dr. Carlos', dia, '08:00', '18:00')
+    erros = []
+
+    def escrever(i):
+        try:
+            for j in range(10):
+                agendar(repositorio, medico_id, data_em(j + 1), f'{8 + i:02d}:00', user_id=i)
+        except Exception as err:
+            erros.append(err)
+
+    threads = [threading.Thread(target=escrever, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert erros == []
+    assert len(repositorio.listar_agendamentos()) == 60
+    assert len(repositorio.ler_eventos(0, limite=1000)) == 60
+    repositorio.fechar()
+
+
+def test_sqlite_mesmo_horario_concorrente_grava_uma_vez(tmp_path):
+    repositorio = RepositorioSQLite(str(tmp_path / 'clinica.db'))
+    repositorio.criar_tabelas()
+    for dia in DIAS_DA_SEMANA.values():
+        medico_id = repositorio.adicionar_medico('Dr. Carlos', dia, '08:00', '18:00')
+    # Todos passaram pela verificação antecipada antes de qualquer um gravar
+    assert repositorio.verificar_disponibilidade(medico_id, data_em(1), '09:00') is None
+    barreira = threading.Barrier(8)
+    gravados, recusados = [], []
+
+    def gravar(i):
+        barreira.wait()
+        try:
+            gravados.append(agendar(repositorio, medico_id, data_em(1), '09:00', user_id=i))
+        except HorarioIndisponivel as err:
+            recusados.append(err.motivo)
+
+    threads = [threading.Thread(target=gravar, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(gravados) == 1
+    assert recusados == ['ocupado'] * 7
+    repositorio.fechar()